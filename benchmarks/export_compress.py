@@ -0,0 +1,84 @@
+"""镜像导出压缩的基准
+
+对一组镜像 tar 分别用单线程 gzip、并行 gzip 和 zstd（多线程）按不同级别压缩，
+输出每种方式的耗时、输入吞吐量和压缩率。数据先读入内存，只测量压缩本身。
+
+用法: python benchmarks/export_compress.py [镜像 tar 文件 ...] [--images 镜像名 ...] [--workers N]
+不指定文件时通过 Docker API 导出 --images 指定的镜像（默认为本机全部带标签镜像中最小的三个）
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_compress import available_formats, compress_stream, default_workers
+
+CHUNK_SIZE = 1024 * 1024
+
+def load_files(paths):
+    return [open(path, 'rb').read() for path in paths]
+
+def load_images(names):
+    """通过 Docker API 保存镜像，未指定时选本机最小的三个带标签镜像"""
+    from docker_client import shared_client
+    client = shared_client.get()
+    if not names:
+        images = sorted((image for image in client.images.list() if image.tags), key=lambda image: image.attrs['Size'])
+        names = [image.tags[0] for image in images[:3]]
+    samples = []
+    for name in names:
+        print(f'导出 {name} ...')
+        samples.append(b''.join(client.images.get(name).save(chunk_size=CHUNK_SIZE)))
+    return samples
+
+def chunked(data):
+    for offset in range(0, len(data), CHUNK_SIZE):
+        yield data[offset:offset + CHUNK_SIZE]
+
+def measure(compress, samples):
+    """返回 (秒, 压缩后字节数)"""
+    started = time.perf_counter()
+    size = sum(len(compress(data)) for data in samples)
+    return time.perf_counter() - started, size
+
+def main():
+    parser = argparse.ArgumentParser(description='镜像导出压缩基准')
+    parser.add_argument('paths', nargs='*', help='docker save 生成的镜像 tar 文件')
+    parser.add_argument('--images', nargs='*', default=[], help='未指定文件时从 Docker 导出的镜像')
+    parser.add_argument('--workers', type=int, default=default_workers(), help='并行压缩的线程数')
+    args = parser.parse_args()
+
+    samples = load_files(args.paths) if args.paths else load_images(args.images)
+    if not samples:
+        print('没有可用的镜像样本')
+        return 1
+    total = sum(len(data) for data in samples)
+    print(f'样本: {len(samples)} 个镜像, 共 {total / 1024 / 1024:.1f} MB, 并行线程 {args.workers}')
+
+    cases = [('gzip (单线程)', level, lambda data, level=level: gzip.compress(data, level)) for level in (1, 6)]
+    cases += [
+        (f'tar.gz ({args.workers} 线程)', level,
+         lambda data, level=level: b''.join(compress_stream(chunked(data), 'tar.gz', level, args.workers)))
+        for level in (1, 6, 9)
+    ]
+    if 'tar.zst' in available_formats():
+        cases += [
+            (f'tar.zst ({args.workers} 线程)', level,
+             lambda data, level=level: b''.join(compress_stream(chunked(data), 'tar.zst', level, args.workers)))
+            for level in (1, 3, 9)
+        ]
+    else:
+        print('未安装 zstandard，跳过 tar.zst')
+
+    print(f"{'方式':<22} {'级别':>4} {'耗时(s)':>9} {'吞吐(MB/s)':>11} {'压缩率':>8}")
+    for name, level, compress in cases:
+        seconds, size = measure(compress, samples)
+        print(f'{name:<22} {level:>4} {seconds:>9.2f} {total / 1024 / 1024 / seconds:>11.1f} {size / total:>8.1%}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""compose 文件 YAML 解析的微基准
+
+对一组真实的 compose 文件分别用纯 Python SafeLoader、libyaml CSafeLoader
+和带缓存的 parse_compose 解析，输出每个文件的平均耗时和相对纯 Python 的加速比。
+
+用法: python benchmarks/yaml_parse.py [目录或文件 ...] [--rounds N]
+不指定路径时使用 config.yaml 中的 compose_root 和仓库自带的 docker-compose.yml
+"""
+import os
+import sys
+import time
+import argparse
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compose_yaml import YAML_ACCELERATED, SafeLoader, YamlParseCache
+
+COMPOSE_NAMES = ('docker-compose.yml', 'docker-compose.yaml', 'compose.yml', 'compose.yaml')
+
+def default_paths():
+    paths = [os.path.join(ROOT, 'docker-compose.yml')]
+    try:
+        with open(os.path.join(ROOT, 'config.yaml'), 'r') as f:
+            compose_root = (yaml.safe_load(f) or {}).get('compose_root')
+        if compose_root:
+            paths.append(compose_root)
+    except OSError:
+        pass
+    return paths
+
+def collect_corpus(paths):
+    """收集路径下的 compose 文件内容"""
+    corpus = []
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = [
+                os.path.join(dirpath, name)
+                for dirpath, _, names in os.walk(path)
+                for name in names if name in COMPOSE_NAMES
+            ]
+        for file in sorted(files):
+            try:
+                with open(file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                yaml.safe_load(content)
+            except (OSError, UnicodeDecodeError, yaml.YAMLError):
+                continue
+            corpus.append(content)
+    return corpus
+
+def measure(parse, corpus, rounds):
+    """返回每个文件的平均解析耗时（微秒）"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for content in corpus:
+            parse(content)
+    return (time.perf_counter() - started) / (rounds * len(corpus)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='compose YAML 解析基准')
+    parser.add_argument('paths', nargs='*', help='compose 文件或包含 compose 文件的目录')
+    parser.add_argument('--rounds', type=int, default=20, help='每种解析方式重复的轮数')
+    args = parser.parse_args()
+
+    corpus = collect_corpus(args.paths or default_paths())
+    if not corpus:
+        print('没有找到可解析的 compose 文件')
+        return 1
+    total_bytes = sum(len(content.encode('utf-8')) for content in corpus)
+    print(f'语料: {len(corpus)} 个文件, 共 {total_bytes / 1024:.1f} KB, 每种方式 {args.rounds} 轮')
+    if not YAML_ACCELERATED:
+        print('libyaml 不可用，CSafeLoader 退回为纯 Python SafeLoader')
+
+    cache = YamlParseCache(max_entries=max(512, len(corpus)))
+    measure(cache.parse, corpus, 1)  # 预热缓存
+    results = [
+        ('yaml.SafeLoader', measure(lambda content: yaml.load(content, Loader=yaml.SafeLoader), corpus, args.rounds)),
+        (SafeLoader.__name__, measure(lambda content: yaml.load(content, Loader=SafeLoader), corpus, args.rounds)),
+        ('parse_compose (cached)', measure(cache.parse, corpus, args.rounds)),
+    ]
+    baseline = results[0][1]
+    for name, micros in results:
+        print(f'{name:<28} {micros:>10.1f} us/文件  {baseline / micros:>8.1f}x')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
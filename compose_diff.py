@@ -0,0 +1,168 @@
+import os
+import json
+from urllib.parse import quote
+import time
+import hashlib
+import threading
+import logging
+from image_refs import parse_env, interpolate
+from compose_yaml import parse_compose
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.diff')
+
+# 以 KEY=VALUE 列表或字典两种形式书写的服务配置项，统一为字典后再计算哈希
+MAPPING_KEYS = ('environment', 'labels', 'extra_hosts', 'sysctls', 'annotations')
+
+def interpolate_all(value, env):
+    """递归替换配置中所有字符串的变量"""
+    if isinstance(value, str):
+        return interpolate(value, env)
+    if isinstance(value, dict):
+        return {key: interpolate_all(item, env) for key, item in value.items()}
+    if isinstance(value, list):
+        return [interpolate_all(item, env) for item in value]
+    return value
+
+def _as_mapping(value):
+    if not isinstance(value, list):
+        return value
+    mapping = {}
+    for item in value:
+        key, sep, item_value = str(item).partition('=')
+        if not sep and ':' in key:
+            # extra_hosts 的 host:ip 写法
+            key, _, item_value = key.partition(':')
+        mapping[key] = item_value if sep or item_value else None
+    return mapping
+
+def _file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def _service_resources(service, compose_data):
+    """返回服务用到的顶层 networks / volumes / configs / secrets 定义"""
+    resources = {}
+    networks = service.get('networks')
+    if networks is None and 'network_mode' not in service:
+        networks = ['default']
+    names = {
+        'networks': list(networks or []),
+        'volumes': [],
+        'configs': [item.get('source') if isinstance(item, dict) else item for item in service.get('configs') or []],
+        'secrets': [item.get('source') if isinstance(item, dict) else item for item in service.get('secrets') or []]
+    }
+    for volume in service.get('volumes') or []:
+        source = volume.get('source') if isinstance(volume, dict) else str(volume).split(':', 1)[0]
+        if source and not source.startswith(('.', '/', '~')):
+            names['volumes'].append(source)
+    for kind, used in names.items():
+        definitions = compose_data.get(kind) or {}
+        if not isinstance(definitions, dict):
+            continue
+        picked = {name: definitions.get(name) for name in used if name in definitions}
+        if picked:
+            resources[kind] = picked
+    return resources
+
+def service_config_hashes(compose_content, env_content, project_path=None):
+    """计算每个服务规范化后有效配置的哈希，返回 {服务名: 哈希}
+
+    替换 .env 变量后按键排序序列化，列表和字典两种写法等价的配置项统一为字典，
+    服务用到的顶层网络、卷、configs、secrets 定义以及 env_file 的内容也计入哈希，
+    因此只改动注释、缩进或键顺序不会被视为变化。YAML 无法解析时抛出 yaml.YAMLError
+    """
+    compose_data = parse_compose(compose_content) or {}
+    if not isinstance(compose_data, dict):
+        return {}
+    # 与 docker compose 相同，进程环境变量优先于 .env
+    env = dict(parse_env(env_content), **os.environ)
+    compose_data = interpolate_all(compose_data, env)
+    hashes = {}
+    for name, service in (compose_data.get('services') or {}).items():
+        if not isinstance(service, dict):
+            continue
+        normalized = dict(service)
+        for key in MAPPING_KEYS:
+            if key in normalized:
+                normalized[key] = _as_mapping(normalized[key])
+        resources = _service_resources(service, compose_data)
+        if resources:
+            normalized['x-resources'] = resources
+        env_files = service.get('env_file')
+        if env_files and project_path:
+            if not isinstance(env_files, list):
+                env_files = [env_files]
+            paths = [item.get('path') if isinstance(item, dict) else item for item in env_files]
+            normalized['x-env-files'] = {
+                path: _file_digest(os.path.join(project_path, path)) for path in paths if path
+            }
+        encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+        hashes[name] = hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+    return hashes
+
+def diff_services(old_hashes, new_hashes):
+    """比较新旧服务哈希，返回 changed / added / removed / unchanged 服务列表"""
+    return {
+        'changed': sorted(name for name in new_hashes if name in old_hashes and new_hashes[name] != old_hashes[name]),
+        'added': sorted(name for name in new_hashes if name not in old_hashes),
+        'removed': sorted(name for name in old_hashes if name not in new_hashes),
+        'unchanged': sorted(name for name in new_hashes if old_hashes.get(name) == new_hashes[name])
+    }
+
+class DeployedConfigStore:
+    """记录每个项目当前运行中的（最近一次部署的）服务配置哈希
+
+    保存为 state_dir/<项目>.json，部署成功后更新，项目停止或删除后移除。
+    保存文件时若项目还没有记录，先记下覆盖前的旧配置，作为差异重新部署的比较基准。
+    """
+
+    def __init__(self, state_dir):
+        self._state_dir = state_dir
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def get(self, project):
+        """返回项目的记录 {'services': {服务名: 哈希}, 'deployed_at': 时间}，没有记录时返回 None"""
+        try:
+            with open(self._path(project), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading deployed config of {project}: {e}")
+            return None
+
+    def record(self, project, services):
+        """记录项目当前运行的服务哈希"""
+        with self._lock:
+            self._write(project, services)
+
+    def record_if_missing(self, project, services):
+        """项目没有记录时记录，返回是否写入"""
+        with self._lock:
+            if os.path.exists(self._path(project)):
+                return False
+            self._write(project, services)
+            return True
+
+    def discard(self, project):
+        with self._lock:
+            try:
+                os.remove(self._path(project))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, project, services):
+        path = self._path(project)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'project': project, 'services': services, 'deployed_at': time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _path(self, project):
+        # 递归发现的项目名含有 /，编码后作为文件名
+        return os.path.join(self._state_dir, quote(project, safe='') + '.json')
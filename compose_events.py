@@ -0,0 +1,256 @@
+import time
+import queue
+import threading
+import logging
+import docker
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.events')
+
+# Docker Compose 写入容器的标签
+COMPOSE_PROJECT_LABEL = 'com.docker.compose.project'
+COMPOSE_WORKING_DIR_LABEL = 'com.docker.compose.project.working_dir'
+COMPOSE_SERVICE_LABEL = 'com.docker.compose.service'
+
+# 容器事件对应的状态，None 表示容器已被删除
+EVENT_STATES = {
+    'create': 'created',
+    'start': 'running',
+    'restart': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'stop': 'exited',
+    'oom': 'exited',
+    'destroy': None
+}
+
+def container_record(container):
+    """把 Engine API 返回的容器信息转换为状态表中的记录"""
+    labels = container.get('Labels') or {}
+    names = container.get('Names') or []
+    return {
+        'project': labels.get(COMPOSE_PROJECT_LABEL),
+        'working_dir': labels.get(COMPOSE_WORKING_DIR_LABEL),
+        'name': names[0].lstrip('/') if names else container.get('Id', '')[:12],
+        'service': labels.get(COMPOSE_SERVICE_LABEL),
+        'state': container.get('State')
+    }
+
+def build_container_groups(records):
+    """按项目标签分组容器记录，统计每个项目运行中和全部的容器数量"""
+    groups = {}
+    for record in records:
+        project = record['project']
+        group = groups.setdefault(project, {
+            'project': project,
+            'working_dir': record['working_dir'],
+            'running': 0,
+            'total': 0,
+            'containers': []
+        })
+        group['total'] += 1
+        if record['state'] == 'running':
+            group['running'] += 1
+        group['containers'].append({
+            'name': record['name'],
+            'service': record['service'],
+            'state': record['state']
+        })
+    return groups
+
+class DockerEventSource:
+    """基于 Docker Engine API 的容器列表和事件流
+
+    ProjectStatusSubscriber 只依赖 list_containers/events/close 三个方法，
+    测试时可替换为本地的假事件源
+    """
+
+    def __init__(self):
+        self._client = docker.from_env()
+
+    def list_containers(self):
+        return self._client.api.containers(all=True, filters={'label': COMPOSE_PROJECT_LABEL})
+
+    def events(self, since):
+        return self._client.events(
+            since=since,
+            filters={'type': 'container', 'label': COMPOSE_PROJECT_LABEL},
+            decode=True
+        )
+
+    def close(self):
+        self._client.close()
+
+class ProjectStatusSubscriber:
+    """订阅 Docker 事件流，维护每个 compose 项目的容器状态表并向订阅者推送变化
+
+    启动和每次重连时先全量同步一次容器列表，再从同步时刻开始消费事件，
+    连接断开（如 Docker 守护进程重启）后按退避间隔重连并重新同步。
+    """
+
+    def __init__(self, source_factory=DockerEventSource, reconnect_delay=1, max_reconnect_delay=30,
+                 queue_size=1000):
+        self._source_factory = source_factory
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._containers = {}
+        self._counts = {}
+        self._subscribers = []
+        self._source = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._synced = False
+
+    @property
+    def synced(self):
+        """状态表是否与 Docker 保持同步"""
+        return self._synced
+
+    def start(self):
+        """启动后台订阅线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='compose-events', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        source = self._source
+        if source:
+            try:
+                source.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def groups(self):
+        """返回与 get_compose_container_groups 相同结构的分组结果，未同步时返回 None"""
+        with self._lock:
+            if not self._synced:
+                return None
+            return build_container_groups(self._containers.values())
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def _run(self):
+        delay = self._reconnect_delay
+        while not self._stop.is_set():
+            try:
+                self._source = self._source_factory()
+                since = int(time.time())
+                self._resync(self._source.list_containers())
+                delay = self._reconnect_delay
+                logger.info("Subscribed to Docker events")
+                for event in self._source.events(since):
+                    if self._stop.is_set():
+                        break
+                    self._apply_event(event)
+                if not self._stop.is_set():
+                    raise ConnectionError('Docker event stream closed')
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.error(f"Docker event subscription lost, reconnecting in {delay}s: {e}")
+            finally:
+                self._synced = False
+                if self._source:
+                    try:
+                        self._source.close()
+                    except Exception:
+                        pass
+                    self._source = None
+            self._stop.wait(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
+
+    def _resync(self, containers):
+        """用完整的容器列表替换状态表，并推送所有发生变化的项目"""
+        with self._lock:
+            self._containers = {
+                container['Id']: container_record(container) for container in containers
+            }
+            projects = set(self._counts) | {r['project'] for r in self._containers.values()}
+            deltas = [self._project_delta(project) for project in projects]
+            self._synced = True
+        self._publish([delta for delta in deltas if delta])
+
+    def _apply_event(self, event):
+        action = (event.get('Action') or event.get('status') or '').split(':')[0]
+        if event.get('Type', 'container') != 'container' or action not in EVENT_STATES:
+            return
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+        container_id = actor.get('ID') or event.get('id')
+        project = attributes.get(COMPOSE_PROJECT_LABEL)
+        if not container_id or not project:
+            return
+
+        with self._lock:
+            state = EVENT_STATES[action]
+            if state is None:
+                self._containers.pop(container_id, None)
+            else:
+                self._containers[container_id] = {
+                    'project': project,
+                    'working_dir': attributes.get(COMPOSE_WORKING_DIR_LABEL),
+                    'name': attributes.get('name', container_id[:12]),
+                    'service': attributes.get(COMPOSE_SERVICE_LABEL),
+                    'state': state
+                }
+            delta = self._project_delta(project)
+        if delta:
+            self._publish([delta])
+
+    def _project_delta(self, project):
+        """重新统计项目的容器数量，数量变化时返回推送内容（需持有锁）"""
+        records = [r for r in self._containers.values() if r['project'] == project]
+        running = sum(1 for r in records if r['state'] == 'running')
+        counts = (running, len(records))
+        if self._counts.get(project) == counts:
+            return None
+        if records:
+            self._counts[project] = counts
+        else:
+            self._counts.pop(project, None)
+        return {
+            'project': project,
+            'working_dir': records[0]['working_dir'] if records else None,
+            'running': running,
+            'total': len(records)
+        }
+
+    def _publish(self, deltas):
+        if not deltas:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            for delta in deltas:
+                try:
+                    q.put_nowait(delta)
+                except queue.Full:
+                    # 订阅者消费过慢时清空队列，改为通知其重新获取完整状态
+                    while True:
+                        try:
+                            q.get_nowait()
+                        except queue.Empty:
+                            break
+                    q.put_nowait({'resync': True})
+                    break
+
+# 全局状态订阅器，首次有浏览器订阅时启动
+status_subscriber = ProjectStatusSubscriber()
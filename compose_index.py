@@ -0,0 +1,372 @@
+import os
+import time
+import fnmatch
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from compose_yaml import parse_compose
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.index')
+
+COMPOSE_FILENAMES = ['docker-compose.yml', 'docker-compose.yaml']
+ENV_FILENAME = '.env'
+# 递归发现项目时的忽略规则文件，每行一个 glob 模式，作用于所在目录及其子目录
+IGNORE_FILENAME = '.wanziignore'
+# 递归发现时不进入的数据目录（只作用于根目录以下的层级，根目录下的同名项目仍会被发现）
+SKIPPED_DIRS = {'volumes', 'volume', 'data', 'node_modules', 'backups'}
+
+def parse_ignore(content):
+    """解析 .wanziignore 内容为模式列表，忽略空行和 # 注释"""
+    patterns = []
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            patterns.append(line.rstrip('/'))
+    return patterns
+
+def is_ignored(path, patterns):
+    """path 为相对于忽略文件所在目录的路径
+
+    以 / 开头或包含 / 的模式匹配整个相对路径，其余模式匹配任意一级目录名
+    """
+    for pattern in patterns:
+        if '/' in pattern:
+            if fnmatch.fnmatch(path, pattern.lstrip('/')):
+                return True
+        elif any(fnmatch.fnmatch(part, pattern) for part in path.split('/')):
+            return True
+    return False
+
+def stat_key(path):
+    """返回文件的 (path, mtime, size) 键，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+class ProjectIndex:
+    """进程内的 Compose 项目索引
+
+    以 (path, mtime, size) 为键缓存每个项目的 compose/.env 内容和解析结果，
+    刷新时只重新读取和解析发生变化的文件，并删除已消失的项目。
+    每当索引内容发生变化时 generation 加一，调用方可据此判断是否需要更新。
+
+    max_depth 大于 1 时递归发现项目（如 infra/web），项目名为相对根目录的路径：
+    已是项目的目录不再深入，跳过隐藏目录、SKIPPED_DIRS 和 .wanziignore 匹配的目录，
+    每层目录按 mtime 缓存列出结果，逐层在线程池中并行扫描。
+    """
+
+    def __init__(self, max_depth=1):
+        self._lock = threading.RLock()
+        self._root = None
+        self._root_mtime = None
+        self._dirs = []
+        self._entries = {}
+        # 不含 compose 文件的目录: 相对路径 -> (mtime, 子目录列表)，目录未变化时不再列出
+        self._plain_dirs = {}
+        # 各目录的 .wanziignore: 相对路径 -> (文件键, 模式列表)
+        self._ignores = {}
+        self.max_depth = max_depth
+        self._generation = 0
+        # 最近一次刷新的各阶段耗时
+        self.last_timings = {}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def root(self):
+        return self._root
+
+    def reset(self, root=None):
+        """清空索引，下次刷新时为新的根目录重建"""
+        with self._lock:
+            self._root = root
+            self._root_mtime = None
+            self._dirs = []
+            self._entries = {}
+            self._plain_dirs = {}
+            self._ignores = {}
+            self._generation += 1
+
+    def invalidate(self, name=None):
+        """使单个项目（或全部项目）的缓存失效"""
+        with self._lock:
+            if name is None:
+                self._root_mtime = None
+                self._plain_dirs = {}
+                for entry in self._entries.values():
+                    entry['_dir_mtime'] = None
+                    entry['_compose_key'] = None
+                    entry['_env_key'] = None
+            elif name in self._entries:
+                entry = self._entries[name]
+                entry['_dir_mtime'] = None
+                entry['_compose_key'] = None
+                entry['_env_key'] = None
+            else:
+                # 新出现的目录需要重新列出其上级目录
+                self._plain_dirs.pop(name, None)
+                parent = os.path.dirname(name)
+                if parent:
+                    self._plain_dirs.pop(parent, None)
+                else:
+                    self._root_mtime = None
+
+    def refresh(self, root, workers=1):
+        """按需刷新索引并返回按名称排序的项目列表
+
+        workers 大于 1 时各项目目录的 stat、读取和解析在有界线程池中并行执行，
+        单个项目出错只影响该项目自身
+        """
+        with self._lock:
+            if root != self._root:
+                logger.info(f"Rebuilding project index for {root}")
+                self.reset(root)
+
+            timings = Counter()
+            started = time.monotonic()
+            root_mtime = os.stat(root).st_mtime_ns
+            if root_mtime != self._root_mtime:
+                self._dirs = sorted(
+                    item for item in os.listdir(root)
+                    if os.path.isdir(os.path.join(root, item))
+                )
+                self._root_mtime = root_mtime
+            patterns = self._ignore_patterns(root, '')
+            timings['list'] = time.monotonic() - started
+
+            changed = False
+            entries = {}
+            plain_dirs = {}
+            level = [item for item in self._dirs if not (patterns and is_ignored(item, patterns))]
+            depth = 1
+            while level:
+                jobs = [
+                    (item, self._entries.get(item), self._plain_dirs.get(item))
+                    for item in level
+                ]
+                if workers > 1 and len(jobs) > 1:
+                    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='project-scan') as executor:
+                        results = list(executor.map(lambda job: self._scan_project(root, *job), jobs))
+                else:
+                    results = [self._scan_project(root, *job) for job in jobs]
+
+                level = []
+                for (item, old_entry, _), (entry, plain, item_changed, item_timings) in zip(jobs, results):
+                    timings.update(item_timings)
+                    if plain is not None:
+                        plain_dirs[item] = plain
+                        if depth < self.max_depth:
+                            level.extend(self._subdirectories(root, item, plain[1]))
+                    if entry is not None:
+                        entries[item] = entry
+                    changed = changed or item_changed or (old_entry is not None and entry is None)
+                depth += 1
+            if set(entries) != set(self._entries):
+                changed = True
+            self._entries = entries
+            # 只保留本次仍然存在的目录的缓存
+            self._plain_dirs = plain_dirs
+            self._ignores = {path: value for path, value in self._ignores.items() if path == '' or path in plain_dirs}
+
+            if changed:
+                self._generation += 1
+
+            timings['total'] = time.monotonic() - started
+            self.last_timings = dict(timings, projects=len(entries), workers=workers)
+            logger.info(
+                f"Indexed {len(entries)} projects with {workers} workers in {timings['total']:.3f}s "
+                f"(list {timings['list']:.3f}s, stat {timings['stat']:.3f}s, "
+                f"read {timings['read']:.3f}s, parse {timings['parse']:.3f}s)"
+            )
+
+            return [self._public(entries[name]) for name in sorted(entries)]
+
+    def entries(self):
+        """返回当前索引中的全部项目（不触发刷新）"""
+        with self._lock:
+            return [self._public(self._entries[name]) for name in sorted(self._entries)]
+
+    def get(self, name):
+        """返回单个项目的索引条目（不触发刷新）"""
+        with self._lock:
+            entry = self._entries.get(name)
+            return self._public(entry) if entry else None
+
+    def directories(self):
+        """返回最近一次刷新扫描到的全部目录（项目目录和普通目录）的相对路径"""
+        with self._lock:
+            return sorted(set(self._entries) | set(self._plain_dirs))
+
+    def signatures(self):
+        """返回 {项目名: (compose 文件键, .env 文件键)}，用于比较两次刷新之间哪些项目发生了变化"""
+        with self._lock:
+            return {name: (entry['_compose_key'], entry['_env_key']) for name, entry in self._entries.items()}
+
+    def _ignore_patterns(self, root, path):
+        """读取目录下的 .wanziignore（按文件键缓存），不存在时返回空列表"""
+        ignore_file = os.path.join(root, path, IGNORE_FILENAME)
+        key = stat_key(ignore_file)
+        cached = self._ignores.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        patterns = []
+        if key is not None:
+            try:
+                with open(ignore_file, 'r', encoding='utf-8') as f:
+                    patterns = parse_ignore(f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                logger.error(f"Error reading {ignore_file}: {e}")
+        self._ignores[path] = (key, patterns)
+        return patterns
+
+    def _subdirectories(self, root, item, subdirs):
+        """返回普通目录 item 下需要继续扫描的子目录，应用各级 .wanziignore 和默认跳过的目录"""
+        rules = []
+        parts = item.split('/')
+        for i in range(len(parts) + 1):
+            base = '/'.join(parts[:i])
+            patterns = self._ignore_patterns(root, base)
+            if patterns:
+                rules.append((base, patterns))
+        children = []
+        for name in subdirs:
+            if name.startswith('.') or name.lower() in SKIPPED_DIRS:
+                continue
+            child = f'{item}/{name}'
+            if any(is_ignored(child[len(base) + 1:] if base else child, patterns) for base, patterns in rules):
+                continue
+            children.append(child)
+        return children
+
+    def _scan_project(self, root, item, entry, plain_mtime):
+        """扫描单个项目目录，不修改索引本身，便于在线程池中执行
+
+        返回 (新条目或 None, 非项目目录的 (mtime, 子目录列表) 或 None, 是否变化, 各阶段耗时)，
+        stat/read/parse 耗时为各线程累计值
+        """
+        timings = Counter()
+        try:
+            return self._scan_project_files(root, item, entry, plain_mtime, timings) + (timings,)
+        except Exception as e:
+            # 文件读取失败、编码错误等都只影响该项目：保留旧条目，下次刷新时重试
+            logger.error(f"Error indexing project {item}: {e}")
+            return entry, None, False, timings
+
+    def _scan_project_files(self, root, item, entry, plain_mtime, timings):
+        project_path = os.path.join(root, item)
+        started = time.monotonic()
+        dir_stat = os.stat(project_path)
+        if entry is None and plain_mtime and plain_mtime[0] == dir_stat.st_mtime_ns:
+            timings['stat'] += time.monotonic() - started
+            return None, plain_mtime, False
+
+        # 目录 mtime 未变时沿用上次列出的文件名，省去 listdir
+        subdirs = []
+        if entry is None or entry['_dir_mtime'] != dir_stat.st_mtime_ns:
+            compose_file = None
+            env_file = None
+            with os.scandir(project_path) as it:
+                for item_entry in it:
+                    if item_entry.name in COMPOSE_FILENAMES:
+                        compose_file = item_entry.path
+                    elif item_entry.name == ENV_FILENAME:
+                        env_file = item_entry.path
+                    elif self.max_depth > 1 and item_entry.is_dir(follow_symlinks=False):
+                        # 递归发现时记下子目录，不跟随符号链接以免循环
+                        subdirs.append(item_entry.name)
+        else:
+            compose_file = entry['compose_file']
+            env_file = entry['env_file']
+
+        if not compose_file:
+            timings['stat'] += time.monotonic() - started
+            return None, (dir_stat.st_mtime_ns, sorted(subdirs)), entry is not None
+
+        if entry is None:
+            entry = {
+                'name': item,
+                'path': project_path,
+                'compose_file': None,
+                'compose_content': None,
+                'compose_name': None,
+                'container_count': 0,
+                'env_file': None,
+                'env_content': None,
+                'created_time': None,
+                '_compose_key': None,
+                '_env_key': None,
+                '_dir_mtime': None
+            }
+            changed = True
+        else:
+            entry = dict(entry)
+            changed = False
+
+        entry['_dir_mtime'] = dir_stat.st_mtime_ns
+        entry['created_time'] = dir_stat.st_ctime
+        entry['compose_file'] = compose_file
+        entry['env_file'] = env_file
+
+        compose_key = stat_key(compose_file)
+        env_key = stat_key(env_file) if env_file else None
+        timings['stat'] += time.monotonic() - started
+
+        if compose_key is None or compose_key != entry['_compose_key']:
+            self._load_compose(entry, compose_file, compose_key, timings)
+            changed = True
+
+        if env_key != entry['_env_key'] or (env_key is None and entry['env_content'] is not None):
+            self._load_env(entry, env_file, env_key, timings)
+            changed = True
+
+        return entry, None, changed
+
+    def _load_compose(self, entry, compose_file, compose_key, timings):
+        try:
+            started = time.monotonic()
+            with open(compose_file, 'r', encoding='utf-8') as f:
+                compose_content = f.read()
+            timings['read'] += time.monotonic() - started
+            # 验证 YAML 格式并获取服务数量
+            started = time.monotonic()
+            compose_data = parse_compose(compose_content)
+            timings['parse'] += time.monotonic() - started
+            entry['compose_content'] = compose_content
+            entry['container_count'] = len(compose_data.get('services', {}))
+            entry['compose_name'] = compose_data.get('name')
+            entry['_compose_key'] = compose_key
+        except Exception as e:
+            logger.error(f"Error reading compose file {compose_file}: {e}")
+            entry['compose_content'] = f"Error: {str(e)}"
+            entry['container_count'] = 0
+            entry['compose_name'] = None
+            # 读取失败（如网络存储抖动）不缓存，下次刷新时重试；格式错误在文件变化前无需重复解析
+            entry['_compose_key'] = None if isinstance(e, OSError) else compose_key
+
+    def _load_env(self, entry, env_file, env_key, timings):
+        entry['_env_key'] = env_key
+        if env_key is None:
+            entry['env_content'] = None
+            return
+        try:
+            started = time.monotonic()
+            with open(env_file, 'r', encoding='utf-8') as f:
+                entry['env_content'] = f.read()
+            timings['read'] += time.monotonic() - started
+        except Exception as e:
+            logger.error(f"Error reading .env file {env_file}: {e}")
+            entry['env_content'] = f"Error: {str(e)}"
+            entry['_env_key'] = None
+
+    @staticmethod
+    def _public(entry):
+        return {k: v for k, v in entry.items() if not k.startswith('_')}
+
+# 全局项目索引
+project_index = ProjectIndex()
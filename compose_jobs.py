@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+from collections import Counter, deque
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.jobs')
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED_STATES = ('success', 'error', 'cancelled', 'interrupted')
+
+class JobCancelled(Exception):
+    """任务在执行过程中被取消"""
+
+class JobQueue:
+    """持久化的后台任务队列
+
+    每个任务的状态保存为 job_dir/<id>.json，输出追加写入 job_dir/<id>.log，
+    进程重启后未开始的任务重新排队，执行中被打断的任务标记为 interrupted。
+    总并发数由 max_workers 限制，同一项目同时执行的任务数由 project_limit 限制。
+    """
+
+    def __init__(self, job_dir, max_workers=4, project_limit=1, retention_days=7):
+        self._job_dir = job_dir
+        self._max_workers = max_workers
+        self._project_limit = project_limit
+        self._retention = retention_days * 86400
+        self._handlers = {}
+        self._jobs = {}
+        self._queue = []
+        self._cancel_events = {}
+        self._running_projects = Counter()
+        self._cond = threading.Condition()
+        self._workers = []
+        # 最近完成任务的 (完成时间, 排队耗时, 执行耗时)，用于统计吞吐量和排队延迟
+        self._completed = deque(maxlen=1000)
+        self._started_at = time.time()
+        os.makedirs(job_dir, exist_ok=True)
+        self._load()
+
+    def register(self, kind, handler):
+        """注册任务处理函数 handler(job, log, cancelled) -> (status, message)"""
+        self._handlers[kind] = handler
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self._max_workers):
+                worker = threading.Thread(target=self._work, name=f'compose-job-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            logger.info(f"Job queue started with {self._max_workers} workers, {len(self._queue)} jobs queued")
+
+    def submit(self, kind, project, params=None):
+        """提交任务并立即返回任务信息"""
+        if kind not in self._handlers:
+            raise ValueError(f'未知的任务类型: {kind}')
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'kind': kind,
+            'project': project,
+            'params': params or {},
+            'state': QUEUED,
+            'message': '',
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        with self._cond:
+            self._jobs[job['id']] = job
+            self._queue.append(job['id'])
+            self._save(job)
+            self._cond.notify_all()
+        self.start()
+        return dict(job)
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, limit=100):
+        """按提交时间倒序返回最近的任务"""
+        with self._cond:
+            jobs = sorted(self._jobs.values(), key=lambda j: j['submitted_at'], reverse=True)
+            return [dict(job) for job in jobs[:limit]]
+
+    def read_log(self, job_id, offset=0, limit=65536):
+        """从字节偏移 offset 开始读取任务输出，返回 (内容, 新偏移)"""
+        log_path = self._path(job_id, '.log')
+        if not os.path.exists(log_path):
+            return '', offset
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(limit)
+        # 不在多字节字符中间截断，剩余字节在下次读取时返回
+        chunk = chunk[:len(chunk) - self._partial_utf8_tail(chunk)]
+        return chunk.decode('utf-8', errors='replace'), offset + len(chunk)
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接取消，执行中的任务通知处理函数尽快停止"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            if job['state'] == QUEUED:
+                self._queue.remove(job_id)
+                self._finish(job, 'cancelled', '任务已取消')
+            elif job['state'] == RUNNING:
+                self._cancel_events[job_id].set()
+            return dict(job)
+
+    def stats(self):
+        """返回队列长度、吞吐量和排队延迟等统计信息"""
+        now = time.time()
+        with self._cond:
+            states = Counter(job['state'] for job in self._jobs.values())
+            completed = list(self._completed)
+            oldest = min((self._jobs[job_id]['submitted_at'] for job_id in self._queue), default=None)
+        window = 300
+        recent = [c for c in completed if now - c[0] <= window]
+        elapsed = min(window, now - self._started_at) or 1
+        return {
+            'workers': self._max_workers,
+            'project_limit': self._project_limit,
+            'states': dict(states),
+            'throughput_per_min': round(len(recent) / elapsed * 60, 2),
+            'queue_latency': self._summary([c[1] for c in completed]),
+            'run_duration': self._summary([c[2] for c in completed]),
+            'oldest_queued_age': round(now - oldest, 3) if oldest else 0
+        }
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_runnable()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_runnable()
+                self._queue.remove(job['id'])
+                self._running_projects[job['project']] += 1
+                cancelled = threading.Event()
+                self._cancel_events[job['id']] = cancelled
+                job['state'] = RUNNING
+                job['started_at'] = time.time()
+                self._save(job)
+            self._run(job, cancelled)
+
+    def _next_runnable(self):
+        """返回最早提交且所属项目未达到并发上限的任务（需持有锁）"""
+        for job_id in self._queue:
+            job = self._jobs[job_id]
+            if self._running_projects[job['project']] < self._project_limit:
+                return job
+        return None
+
+    def _run(self, job, cancelled):
+        log_path = self._path(job['id'], '.log')
+        try:
+            with open(log_path, 'a', encoding='utf-8') as log_file:
+                write_lock = threading.Lock()
+
+                def log(line, stream='stdout'):
+                    # stdout 和 stderr 由不同线程读取，逐行加锁写入
+                    with write_lock:
+                        log_file.write(line + '\n')
+                        log_file.flush()
+
+                try:
+                    status, message = self._handlers[job['kind']](job, log, cancelled)
+                except JobCancelled:
+                    status, message = 'cancelled', '任务已取消'
+                if cancelled.is_set() and status != 'success':
+                    status, message = 'cancelled', '任务已取消'
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']} {job['project']}) failed: {e}")
+            status, message = 'error', str(e)
+
+        with self._cond:
+            self._running_projects[job['project']] -= 1
+            self._cancel_events.pop(job['id'], None)
+            self._finish(job, status, message)
+            self._cond.notify_all()
+
+    def _finish(self, job, state, message):
+        """记录任务结束（需持有锁）"""
+        job['state'] = state
+        job['message'] = message
+        job['finished_at'] = time.time()
+        if job['started_at']:
+            self._completed.append((
+                job['finished_at'],
+                job['started_at'] - job['submitted_at'],
+                job['finished_at'] - job['started_at']
+            ))
+        self._save(job)
+
+    def _load(self):
+        """加载持久化的任务：排队中的任务重新排队，执行中的任务标记为中断"""
+        now = time.time()
+        for filename in os.listdir(self._job_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self._job_dir, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading job {filename}: {e}")
+                continue
+
+            if job['state'] in FINISHED_STATES and now - (job['finished_at'] or 0) > self._retention:
+                for suffix in ('.json', '.log'):
+                    try:
+                        os.unlink(self._path(job['id'], suffix))
+                    except OSError:
+                        pass
+                continue
+            if job['state'] == RUNNING:
+                job['state'] = 'interrupted'
+                job['message'] = '服务重启时任务被中断'
+                job['finished_at'] = now
+                self._save(job)
+            self._jobs[job['id']] = job
+
+        self._queue = [
+            job['id'] for job in sorted(self._jobs.values(), key=lambda j: j['submitted_at'])
+            if job['state'] == QUEUED
+        ]
+
+    def _save(self, job):
+        """原子地写入任务状态"""
+        path = self._path(job['id'], '.json')
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error saving job {job['id']}: {e}")
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self._job_dir, os.path.basename(job_id) + suffix)
+
+    @staticmethod
+    def _partial_utf8_tail(chunk):
+        """返回末尾不完整的 UTF-8 字符占用的字节数"""
+        for i in range(1, min(4, len(chunk)) + 1):
+            byte = chunk[-i]
+            if byte & 0xC0 == 0xC0:
+                # 多字节字符的首字节，判断该字符是否完整
+                length = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4
+                return i if length > i else 0
+            if byte & 0x80 == 0:
+                return 0
+        return 0
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return {'count': 0, 'avg': 0, 'p95': 0, 'max': 0}
+        ordered = sorted(values)
+        return {
+            'count': len(ordered),
+            'avg': round(sum(ordered) / len(ordered), 3),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            'max': round(ordered[-1], 3)
+        }
@@ -1,15 +1,38 @@
-from flask import Blueprint, render_template, request, jsonify, abort, session
+from flask import (Blueprint, render_template, get_template_attribute, current_app, request, jsonify, abort,
+                   session, Response, send_file)
 import os
 import yaml
 import logging
 import subprocess
 import json
 from languages import load_language, SUPPORTED_LANGUAGES
+from compose_index import project_index, stat_key, COMPOSE_FILENAMES, ENV_FILENAME
+from compose_watcher import ComposeRootWatcher
+from compose_events import (status_subscriber, build_container_groups, container_record,
+                            COMPOSE_PROJECT_LABEL)
+from compose_jobs import JobQueue, JobCancelled
+from operation_history import OperationHistory
+from log_reader import read_range, tail_lines, read_new_lines
+from log_search import LogSearchIndex
+from directory_listing import DirectoryListingCache, paginate
+from image_cleanup import ImageRemovalPlanner, format_bytes
+from image_refs import image_reference_index, project_pull_refs
+from image_prepull import ImagePrePuller, describe_pull_event
+from docker_client import shared_client
+from image_delta import layer_store
+from container_stats import ContainerStatsSampler
+from compose_yaml import parse_compose
+from compose_diff import DeployedConfigStore, service_config_hashes, diff_services
 import requests
 import time
 from datetime import datetime
 import re
 import shlex
+import shutil
+import queue
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # 创建蓝图
 compose_bp = Blueprint('compose', __name__)
@@ -62,24 +85,9 @@ def log_operation(operation, project_name, status, message=''):
     else:
         logger.error(f"{operation} - {project_name} - {message}")
     
-    # 保存到操作历史文件
-    history_file = os.path.join(LOG_DIR, 'operation_history.json')
+    # 追加到操作历史库
     try:
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        history.append(log_entry)
-        
-        # 只保留最近1000条记录
-        if len(history) > 1000:
-            history = history[-1000:]
-        
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-            
+        operation_history.append(log_entry)
     except Exception as e:
         logger.error(f"Error saving operation history: {e}")
 
@@ -96,6 +104,89 @@ def load_config():
 # 从配置文件获取 Docker Compose 项目目录
 config = load_config()
 COMPOSE_ROOT = config.get('compose_root', '/mnt/nas/docker')
+# 扫描项目目录时使用的线程数
+SCAN_WORKERS = max(1, int(config.get('scan_workers', 8)))
+# 项目发现的最大目录深度，1 表示只查找根目录下一级，大于 1 时递归查找分组目录中的项目（如 infra/web）
+project_index.max_depth = max(1, int(config.get('scan_depth', 1)))
+# 批量部署时同时执行的项目数
+DEPLOY_PARALLEL = max(1, int(config.get('deploy_parallel', 4)))
+# 共享 Docker 客户端的连接池大小和 API 超时（秒）
+shared_client.configure(
+    pool_size=max(1, int(config.get('docker_pool_size', 16))),
+    timeout=max(1, int(config.get('docker_timeout', 120)))
+)
+# 导入过的镜像层的保存目录和大小上限（GiB），用于补全增量归档中省略的层；
+# 默认放在挂载到宿主机的日志目录下，避免写入容器的可写层
+layer_store.configure(
+    root=config.get('layer_store_dir') or os.path.join(LOG_DIR, 'layer_store'),
+    max_size=int(max(0, float(config.get('layer_store_max_size', 20))) * 1024 ** 3)
+)
+# 按项目汇总容器资源使用的采样间隔（秒，0 表示不采样）和并发获取 stats 的线程数
+STATS_INTERVAL = max(0, int(config.get('stats_interval', 10)))
+stats_sampler = ContainerStatsSampler(
+    shared_client.get,
+    interval=STATS_INTERVAL,
+    workers=max(1, int(config.get('stats_workers', 4)))
+)
+# 部署 up 前是否默认预拉取镜像，以及并发拉取的镜像数
+DEPLOY_PREPULL = bool(config.get('deploy_prepull', False))
+image_prepuller = ImagePrePuller(max_workers=max(1, int(config.get('pull_workers', 3))))
+# 清理镜像时并发调用 Docker API 的线程数
+IMAGE_REMOVE_WORKERS = max(1, int(config.get('image_remove_workers', 4)))
+
+# 监听项目目录的变化：auto 时本地文件系统用 inotify、网络文件系统轮询，也可指定 inotify / poll / off
+project_watcher = ComposeRootWatcher(
+    project_index,
+    mode=config.get('watch_mode', 'auto'),
+    poll_interval=max(1, int(config.get('watch_interval', 5))),
+    workers=SCAN_WORKERS
+)
+
+def image_reference_source():
+    """镜像引用索引的项目来源：增量刷新项目索引并返回 (generation, 项目列表)"""
+    projects = project_index.refresh(COMPOSE_ROOT, workers=SCAN_WORKERS)
+    return project_index.generation, projects
+
+image_reference_index.set_project_source(image_reference_source)
+
+# 后台任务队列：总并发数和单个项目的并发数
+job_queue = JobQueue(
+    os.path.join(LOG_DIR, 'jobs'),
+    max_workers=max(1, int(config.get('job_workers', 4))),
+    project_limit=max(1, int(config.get('job_project_limit', 1)))
+)
+
+# 各项目运行中的服务配置哈希，用于只重建配置变化的服务
+deployed_configs = DeployedConfigStore(os.path.join(LOG_DIR, 'deployed'))
+
+# 操作历史：按天数保留，首次启动时导入旧的 operation_history.json
+operation_history = OperationHistory(
+    os.path.join(LOG_DIR, 'operation_history.db'),
+    retention_days=int(config.get('history_retention_days', 90)),
+    legacy_json=os.path.join(LOG_DIR, 'operation_history.json')
+)
+
+# 操作日志每页显示的记录数
+HISTORY_PAGE_SIZE = 50
+
+# 日志文件默认返回的行数和单次读取上限
+LOG_TAIL_LINES = 1000
+LOG_MAX_LINES = 20000
+LOG_MAX_READ = 4 * 1024 * 1024
+# 跟随日志时检查新内容的间隔（秒）
+LOG_FOLLOW_INTERVAL = 1
+
+# 日志文件全文索引，查询时增量索引新追加的内容
+log_search_index = LogSearchIndex(
+    os.path.join(LOG_DIR, 'log_index.db'),
+    LOG_DIR,
+    project_source=lambda: [project['name'] for project in project_index.entries()]
+)
+
+# 目录选择器每页返回的目录数量和上限，最近浏览的目录缓存 30 秒
+DIRECTORY_PAGE_SIZE = 200
+DIRECTORY_MAX_PAGE_SIZE = 1000
+directory_cache = DirectoryListingCache(ttl=30)
 
 # 添加配置文件路径
 REGISTRY_CONFIG_FILE = 'compose_registry_config.json'
@@ -121,92 +212,132 @@ def save_registry_config_file(config):
         logger.error(f"Error saving registry config: {e}")
         return False
 
-def get_compose_projects():
-    """扫描并获取所有 Docker Compose 项目"""
+def get_compose_projects(container_groups=None):
+    """扫描并获取所有 Docker Compose 项目
+
+    项目文件内容来自增量索引，只有发生变化的文件才会重新读取和解析；
+    container_groups 为 get_compose_container_groups() 的结果，未提供时在扫描中获取一次，
+    所有项目的运行状态都从这一次快照中得出
+    """
     projects = []
     try:
         logger.info(f"Scanning compose projects in {COMPOSE_ROOT}")
-        # 遍第一层目录
-        for item in os.listdir(COMPOSE_ROOT):
-            project_path = os.path.join(COMPOSE_ROOT, item)
-            if os.path.isdir(project_path):
-                # 查找 docker-compose.yml 或 docker-compose.yaml
-                compose_file = None
-                env_file = None
-                for filename in os.listdir(project_path):
-                    if filename in ['docker-compose.yml', 'docker-compose.yaml']:
-                        compose_file = os.path.join(project_path, filename)
-                    elif filename == '.env':
-                        env_file = os.path.join(project_path, filename)
-                
-                if compose_file:
-                    # 读取 compose 文件内容
-                    try:
-                        with open(compose_file, 'r', encoding='utf-8') as f:
-                            compose_content = f.read()
-                            # 验证 YAML 格式并获取服务数量
-                            compose_data = yaml.safe_load(compose_content)
-                            container_count = len(compose_data.get('services', {}))
-                    except Exception as e:
-                        logger.error(f"Error reading compose file {compose_file}: {e}")
-                        compose_content = f"Error: {str(e)}"
-                        container_count = 0
-                    
-                    # 读取 .env 文件内容
-                    env_content = None
-                    if env_file and os.path.exists(env_file):
-                        try:
-                            with open(env_file, 'r', encoding='utf-8') as f:
-                                env_content = f.read()
-                        except Exception as e:
-                            logger.error(f"Error reading .env file {env_file}: {e}")
-                            env_content = f"Error: {str(e)}"
-                    
-                    # 获取项目状态和容器数量
-                    status, running_containers = check_project_status(item)
-                    
-                    # 获取创建时间（使用目录的创建时间）
-                    created_time = os.path.getctime(project_path)
-                    
-                    projects.append({
-                        'name': item,
-                        'path': project_path,
-                        'compose_file': compose_file,
-                        'compose_content': compose_content,
-                        'env_file': env_file,
-                        'env_content': env_content,
-                        'status': status,
-                        'container_count': container_count,
-                        'running_containers': running_containers,
-                        'created_time': created_time,
-                        'relative_path': os.path.relpath(project_path, COMPOSE_ROOT)
-                    })
+        projects = project_index.refresh(COMPOSE_ROOT, workers=SCAN_WORKERS)
+        image_reference_index.update_projects(projects, project_index.generation)
+
+        started = time.monotonic()
+        if container_groups is None:
+            container_groups = get_compose_container_groups()
+        if container_groups is None and len(projects) > 1 and SCAN_WORKERS > 1:
+            # Docker API 不可用时逐项目检查，同样放入线程池
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix='project-status') as executor:
+                statuses = list(executor.map(lambda p: check_project_status(p['name'], p['compose_name']), projects))
+        else:
+            statuses = [
+                resolve_project_status(project['name'], container_groups, project['compose_name'])
+                for project in projects
+            ]
+        logger.info(f"Resolved status of {len(projects)} projects in {time.monotonic() - started:.3f}s")
+
+        for project, (status, running_containers) in zip(projects, statuses):
+            project.update({
+                'status': status,
+                'running_containers': running_containers,
+                'relative_path': os.path.relpath(project['path'], COMPOSE_ROOT)
+            })
     except Exception as e:
         error_msg = f"Error scanning compose projects: {e}"
         logger.error(error_msg)
         log_operation('scan_projects', 'all', 'error', error_msg)
+        projects = [project for project in projects if 'status' in project]
     
     return sorted(projects, key=lambda x: x['name'])
 
-def check_project_status(project_name):
-    """检查项目运行状态和容器数量"""
+def project_label(project_name, compose_name=None):
+    """返回项目容器的 com.docker.compose.project 标签值"""
+    return compose_name or normalize_project_name(os.path.basename(project_name))
+
+def project_containers(project_name, compose_name=None):
+    """通过共享 Docker 客户端获取单个项目的全部容器"""
+    label = project_label(project_name, compose_name)
+    return shared_client.get().api.containers(
+        all=True, filters={'label': f'{COMPOSE_PROJECT_LABEL}={label}'})
+
+def check_project_status(project_name, compose_name=None):
+    """检查单个项目的运行状态和容器数量（一次性获取全部容器失败时逐项目使用）"""
     try:
-        result = subprocess.run(
-            ['docker', 'compose', 'ps', '--format', 'json'],
-            cwd=os.path.join(COMPOSE_ROOT, project_name),
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            stdout_fixed = result.stdout.strip().replace('}\n{', '},{')
-            containers = json.loads(f"[{stdout_fixed}]")
-            running_count = sum(1 for c in containers if c.get('State') == 'running')
-            return 'running' if running_count > 0 else 'stopped', running_count
-        return 'stopped', 0
+        containers = project_containers(project_name, compose_name)
+        running_count = sum(1 for c in containers if c.get('State') == 'running')
+        return 'running' if running_count > 0 else 'stopped', running_count
     except Exception as e:
         logger.error(f"Error checking project status: {e}")
         return 'unknown', 0
 
+def normalize_project_name(name):
+    """按 docker compose 的规则把目录名转换为项目名（小写，仅保留字母数字、_ 和 -）"""
+    return re.sub(r'[^a-z0-9_-]', '', name.lower()).lstrip('_-')
+
+def get_compose_container_groups():
+    """获取所有 compose 容器并按项目标签分组
+
+    事件订阅器已同步时直接使用其状态表，否则通过一次 Docker Engine API 调用获取。
+    返回 {项目标签: {'project', 'working_dir', 'running', 'total', 'containers'}}，
+    Docker API 不可用时返回 None，由调用方回退到逐项目检查
+    """
+    groups = status_subscriber.groups()
+    if groups is not None:
+        return groups
+    try:
+        containers = shared_client.get().api.containers(
+            all=True, filters={'label': COMPOSE_PROJECT_LABEL})
+    except Exception as e:
+        logger.error(f"Error listing compose containers: {e}")
+        shared_client.reset(e)
+        return None
+    return build_container_groups(container_record(container) for container in containers)
+
+def find_project_group(project_name, container_groups, compose_name=None):
+    """在容器分组中查找项目目录对应的分组
+
+    递归发现的项目名为相对路径（如 infra/web），compose 默认以最后一级目录名作为项目名
+    """
+    dir_name = os.path.basename(project_name)
+    for label in (compose_name, normalize_project_name(dir_name)):
+        if label and label in container_groups:
+            return container_groups[label]
+    # 项目名被 COMPOSE_PROJECT_NAME 等方式覆盖时，按工作目录名匹配
+    for group in container_groups.values():
+        working_dir = group.get('working_dir')
+        if working_dir and os.path.basename(working_dir.rstrip('/')) == dir_name:
+            return group
+    return None
+
+def resolve_project_status(project_name, container_groups, compose_name=None):
+    """从容器快照中得出项目状态和运行中的容器数量"""
+    if container_groups is None:
+        return check_project_status(project_name, compose_name)
+    group = find_project_group(project_name, container_groups, compose_name)
+    if not group or group['running'] == 0:
+        return 'stopped', 0
+    return 'running', group['running']
+
+def find_orphan_groups(container_groups, projects):
+    """找出项目目录已不存在的 compose 容器分组"""
+    if not container_groups:
+        return []
+    matched = set()
+    for project in projects:
+        group = find_project_group(project['name'], container_groups, project.get('compose_name'))
+        if group:
+            matched.add(group['project'])
+    orphans = []
+    for label, group in sorted(container_groups.items(), key=lambda x: x[0] or ''):
+        if label in matched:
+            continue
+        working_dir = group.get('working_dir')
+        orphans.append(dict(group, working_dir_exists=bool(working_dir and os.path.isdir(working_dir))))
+    return orphans
+
 @compose_bp.route('/')
 def index():
     """显示项目列表"""
@@ -214,13 +345,116 @@ def index():
     current_lang = session.get('language', 'zh_CN')
     lang = load_language(current_lang)
     
-    projects = get_compose_projects()
+    # 列表页只渲染元数据，文件内容由 get_project_files 按需加载
+    projects = [
+        {k: v for k, v in project.items() if k not in ('compose_content', 'env_content')}
+        for project in get_compose_projects()
+    ]
+    image_refs = image_reference_index.project_refs()
+    for project in projects:
+        project['images'] = sorted(image_refs.get(project['name'], ()))
     return render_template('compose_manager.html', 
                          projects=projects,
                          lang=lang,
                          current_lang=current_lang,
                          supported_languages=SUPPORTED_LANGUAGES)
 
+@compose_bp.route('/projects/<path:project_name>/files')
+def get_project_files(project_name):
+    """按需获取单个项目的 compose 和 .env 文件内容
+
+    ETag 由文件的 (path, mtime, size) 计算，If-None-Match 命中时直接返回 304，不读取文件
+    """
+    try:
+        project_path = os.path.join(COMPOSE_ROOT, project_name)
+        if '..' in project_name.split('/') or project_name in ('.', '') or not os.path.isdir(project_path):
+            return jsonify({'status': 'error', 'message': '项目不存在'})
+        
+        compose_file = None
+        for filename in COMPOSE_FILENAMES:
+            if os.path.isfile(os.path.join(project_path, filename)):
+                compose_file = os.path.join(project_path, filename)
+                break
+        if not compose_file:
+            return jsonify({'status': 'error', 'message': '项目不存在'})
+        env_file = os.path.join(project_path, ENV_FILENAME)
+        
+        file_keys = [stat_key(compose_file), stat_key(env_file)]
+        etag = hashlib.sha1(repr(file_keys).encode('utf-8')).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        with open(compose_file, 'r', encoding='utf-8') as f:
+            compose_content = f.read()
+        env_content = None
+        if file_keys[1] is not None:
+            with open(env_file, 'r', encoding='utf-8') as f:
+                env_content = f.read()
+        
+        response = jsonify({
+            'status': 'success',
+            'project': project_name,
+            'compose_content': compose_content,
+            'env_content': env_content
+        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error reading files of project {project_name}: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@compose_bp.route('/projects/summary')
+def get_project_summary():
+    """返回指定项目（name 参数可重复）的状态、容器数量和元数据，供列表在项目变化时只更新对应的行
+
+    html 为该项目在列表中的一行，用于插入新增的项目；已删除的项目不出现在结果中
+    """
+    try:
+        names = request.args.getlist('name')
+        if not names:
+            return jsonify({'status': 'error', 'message': '缺少项目名称'})
+        lang = load_language(session.get('language', 'zh_CN'))
+        # 增量刷新，只重新读取发生变化的项目
+        projects = project_index.refresh(COMPOSE_ROOT, workers=SCAN_WORKERS)
+        image_reference_index.update_projects(projects, project_index.generation)
+        image_refs = image_reference_index.project_refs()
+        container_groups = get_compose_container_groups()
+        project_item = get_template_attribute('compose_project_item.html', 'project_item')
+        format_datetime = current_app.jinja_env.filters['datetime']
+        result = {}
+        for project in projects:
+            if project['name'] not in names:
+                continue
+            project = {k: v for k, v in project.items() if k not in ('compose_content', 'env_content')}
+            status, running_containers = resolve_project_status(
+                project['name'], container_groups, project['compose_name'])
+            project.update({
+                'status': status,
+                'running_containers': running_containers,
+                'relative_path': os.path.relpath(project['path'], COMPOSE_ROOT),
+                'images': sorted(image_refs.get(project['name'], ()))
+            })
+            result[project['name']] = {
+                'status': status,
+                'status_text': lang['compose']['project']['status'].get(status, status),
+                'running_containers': running_containers,
+                'container_count': project['container_count'],
+                'images': project['images'],
+                'created_time': project['created_time'],
+                'created': format_datetime(project['created_time']),
+                'env_file': bool(project.get('env_file')),
+                'html': str(project_item(project, lang))
+            }
+        return jsonify({'status': 'success', 'projects': result})
+    except Exception as e:
+        logger.error(f"Error getting project summary: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @compose_bp.route('/save', methods=['POST'])
 def save_file():
     """保存文件内容"""
@@ -242,25 +476,301 @@ def save_file():
             file_path = os.path.join(project_path, 'docker-compose.yml')
             # 验证 YAML 格式
             try:
-                yaml.safe_load(content)
+                parse_compose(content)
             except yaml.YAMLError as e:
                 return jsonify({'status': 'error', 'message': f'YAML格式错误: {str(e)}'})
         else:
             file_path = os.path.join(project_path, '.env')
         
+        # 首次修改时记下覆盖前的配置，作为重新部署变化服务的比较基准
+        old_hashes = None
+        try:
+            old_hashes = current_service_hashes(project_name)
+            if old_hashes is not None:
+                deployed_configs.record_if_missing(project_name, old_hashes)
+        except Exception as e:
+            logger.error(f"Error hashing services of {project_name} before save: {e}")
+        
         # 保存文件
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(content)
         
-        return jsonify({'status': 'success', 'message': '保存成功'})
+        result = {'status': 'success', 'message': '保存成功'}
+        deployed = deployed_configs.get(project_name)
+        if deployed is not None:
+            try:
+                changes = diff_services(deployed['services'], current_service_hashes(project_name) or {})
+                changes.pop('unchanged')
+                result['changes'] = changes
+            except Exception as e:
+                logger.error(f"Error diffing services of {project_name}: {e}")
+        return jsonify(result)
         
     except Exception as e:
         logger.error(f"Error saving file: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+def run_compose_command(cmd, cwd, on_line, cancel=None):
+    """执行命令并同时读取 stdout 和 stderr，每输出一行调用 on_line(stream, line)，返回退出码
+
+    两个管道各由一个线程读取，避免 stderr 写满管道缓冲区导致进程阻塞；
+    cancel 事件被设置时终止进程
+    """
+    process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1
+    )
+    
+    def pump(pipe, stream):
+        with pipe:
+            for line in pipe:
+                line = line.strip()
+                if line:
+                    on_line(stream, line)
+    
+    readers = [
+        threading.Thread(target=pump, args=(process.stdout, 'stdout'), daemon=True),
+        threading.Thread(target=pump, args=(process.stderr, 'stderr'), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    while True:
+        try:
+            process.wait(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel and cancel.is_set():
+                process.terminate()
+    for reader in readers:
+        reader.join()
+    return process.returncode
+
+def project_line_handler(project, on_line, logs):
+    """返回处理项目命令输出的回调：写入日志，并回调 on_line(stream, line) 或收集到 logs"""
+    def handle_line(stream, line):
+        if stream == 'stderr':
+            logger.error(f"{project} - {line}")
+        else:
+            logger.info(f"{project} - {line}")
+        if on_line:
+            on_line(stream, line)
+        else:
+            logs.append(line)
+    return handle_line
+
+def current_service_hashes(project):
+    """计算项目当前 compose 文件中每个服务的配置哈希，没有 compose 文件时返回 None"""
+    project_path = os.path.join(COMPOSE_ROOT, project)
+    for filename in COMPOSE_FILENAMES:
+        compose_file = os.path.join(project_path, filename)
+        if os.path.isfile(compose_file):
+            break
+    else:
+        return None
+    with open(compose_file, 'r', encoding='utf-8') as f:
+        compose_content = f.read()
+    env_content = None
+    env_file = os.path.join(project_path, ENV_FILENAME)
+    if os.path.isfile(env_file):
+        with open(env_file, 'r', encoding='utf-8') as f:
+            env_content = f.read()
+    return service_config_hashes(compose_content, env_content, project_path)
+
+def update_deployed_config(project, action):
+    """部署成功后更新项目运行中的服务配置记录，停止后移除"""
+    try:
+        if action == 'up':
+            hashes = current_service_hashes(project)
+            if hashes is not None:
+                deployed_configs.record(project, hashes)
+        else:
+            deployed_configs.discard(project)
+    except Exception as e:
+        logger.error(f"Error recording deployed config of {project}: {e}")
+
+def start_prepull(projects, on_event=None, cancel=None):
+    """开始并发预拉取项目需要的镜像（跨项目去重），Docker 不可用时返回 None，由 compose up 自行拉取"""
+    project_index.refresh(COMPOSE_ROOT, workers=SCAN_WORKERS)
+    images = {}
+    for project in projects:
+        entry = project_index.get(project)
+        if entry:
+            images[project] = project_pull_refs(
+                project, entry['compose_name'], entry['compose_content'], entry['env_content'])
+    try:
+        return image_prepuller.start(images, on_event, cancel)
+    except Exception as e:
+        logger.error(f"Error starting image pre-pull: {e}")
+        return None
+
+def deploy_project(project, action, on_line=None, cancel=None, prepull=None):
+    """对单个项目执行 docker compose up -d / down，返回该项目的部署结果
+
+    未提供 on_line 时输出收集到结果的 logs 中；提供时逐行回调 on_line(stream, line)，不在内存中保留输出。
+    prepull 为 start_prepull() 返回的预拉取，up 前等待本项目的镜像拉取完成，结果中的 pull_wait 为等待时间
+    """
+    started = time.monotonic()
+    project_path = os.path.join(COMPOSE_ROOT, project)
+    if not os.path.exists(project_path):
+        error_msg = '项目不存在'
+        log_operation(f'deploy_{action}', project, 'error', error_msg)
+        return {
+            'project': project,
+            'status': 'error',
+            'message': error_msg,
+            'logs': [],
+            'duration': round(time.monotonic() - started, 3)
+        }
+    
+    try:
+        cmd = ['docker', 'compose']
+        if action == 'up':
+            cmd.extend(['up', '-d'])
+        else:
+            cmd.extend(['down'])
+        
+        logger.info(f"Executing command for {project}: {' '.join(cmd)}")
+        
+        # 执行命令并实时捕获输出
+        logs = []
+        handle_line = project_line_handler(project, on_line, logs)
+        
+        pull_wait = None
+        if prepull and action == 'up':
+            pull_wait, failed = prepull.wait(project)
+            handle_line('stdout', f"镜像预拉取完成，等待 {pull_wait}s")
+            for image in failed:
+                # 预拉取失败时交给 compose up 自行拉取，由其报告具体错误
+                handle_line('stderr', f"预拉取镜像 {image} 失败")
+        
+        returncode = run_compose_command(cmd, project_path, handle_line, cancel)
+        
+        if returncode == 0:
+            status = 'success'
+            message = f'项目{action}成功'
+            update_deployed_config(project, action)
+        else:
+            status = 'error'
+            message = f'项目{action}失败'
+        log_operation(f'deploy_{action}', project, status, message)
+        result = {
+            'project': project,
+            'status': status,
+            'message': message,
+            'logs': logs,
+            'duration': round(time.monotonic() - started, 3)
+        }
+        if pull_wait is not None:
+            result['pull_wait'] = pull_wait
+        return result
+            
+    except Exception as e:
+        error_msg = str(e)
+        log_operation(f'deploy_{action}', project, 'error', error_msg)
+        return {
+            'project': project,
+            'status': 'error',
+            'message': error_msg,
+            'logs': [],
+            'duration': round(time.monotonic() - started, 3)
+        }
+
+def redeploy_project(project, on_line=None, cancel=None):
+    """只重建配置发生变化的服务，其余服务保持运行
+
+    比较运行中的服务配置哈希和当前文件中的哈希：变化和新增的服务用
+    up -d --no-deps --force-recreate 重建，已删除的服务通过 --remove-orphans 移除。
+    没有比较基准或项目未运行时退回整体 up -d。结果中的 recreated 为重建的服务
+    """
+    started = time.monotonic()
+    project_path = os.path.join(COMPOSE_ROOT, project)
+    if not os.path.isdir(project_path):
+        log_operation('redeploy', project, 'error', '项目不存在')
+        return {'project': project, 'status': 'error', 'message': '项目不存在', 'logs': [],
+                'duration': round(time.monotonic() - started, 3)}
+    
+    try:
+        new_hashes = current_service_hashes(project)
+        if new_hashes is None:
+            raise Exception('项目不存在')
+        deployed = deployed_configs.get(project)
+        entry = project_index.get(project)
+        status, _ = resolve_project_status(project, get_compose_container_groups(),
+                                           entry['compose_name'] if entry else None)
+        if deployed is None or status != 'running':
+            result = deploy_project(project, 'up', on_line, cancel)
+            result.update(mode='full', recreated=sorted(new_hashes) if result['status'] == 'success' else [])
+            return result
+        
+        changes = diff_services(deployed['services'], new_hashes)
+        targets = changes['changed'] + changes['added']
+        logs = []
+        result = dict(changes, project=project, mode='diff', recreated=[], logs=logs)
+        if not targets and not changes['removed']:
+            result.update(status='success', message='服务配置没有变化，无需重新部署',
+                          duration=round(time.monotonic() - started, 3))
+            return result
+        
+        cmd = ['docker', 'compose', 'up', '-d', '--no-deps']
+        if changes['removed']:
+            cmd.append('--remove-orphans')
+        if targets:
+            cmd.append('--force-recreate')
+            cmd.extend(targets)
+        logger.info(f"Executing command for {project}: {' '.join(cmd)}")
+        returncode = run_compose_command(cmd, project_path, project_line_handler(project, on_line, logs), cancel)
+        
+        if returncode == 0:
+            deployed_configs.record(project, new_hashes)
+            result['recreated'] = targets
+            result['status'] = 'success'
+            result['message'] = f"重建服务 {len(targets)} 个，移除 {len(changes['removed'])} 个，" \
+                                f"保持运行 {len(changes['unchanged'])} 个"
+        else:
+            result['status'] = 'error'
+            result['message'] = '重新部署失败'
+        result['duration'] = round(time.monotonic() - started, 3)
+        log_operation('redeploy', project, result['status'], result['message'])
+        return result
+    
+    except Exception as e:
+        error_msg = str(e)
+        log_operation('redeploy', project, 'error', error_msg)
+        return {'project': project, 'status': 'error', 'message': error_msg, 'logs': [],
+                'duration': round(time.monotonic() - started, 3)}
+
+@compose_bp.route('/redeploy', methods=['POST'])
+def redeploy_changes():
+    """保存文件后只重新部署配置变化的服务（background 为真时提交为后台任务）"""
+    try:
+        data = request.json
+        project = data.get('project')
+        if not project:
+            return jsonify({'status': 'error', 'message': '缺少必要参数'})
+        
+        if data.get('background'):
+            job = job_queue.submit('redeploy', project)
+            return jsonify({'status': 'success', 'job_id': job['id']})
+        
+        result = redeploy_project(project)
+        logger.info(f"Redeployed {project} ({result.get('mode')}): recreated {result.get('recreated')} "
+                    f"in {result['duration']}s")
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"Error in redeploy_changes: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @compose_bp.route('/deploy', methods=['POST'])
 def deploy_projects():
-    """部署选中的项目"""
+    """部署选中的项目（background 为真时每个项目提交为一个后台任务）
+
+    多个项目按 max_parallel（默认取配置 deploy_parallel）并发执行，结果顺序与请求一致
+    """
     try:
         data = request.json
         projects = data.get('projects', [])
@@ -269,97 +779,38 @@ def deploy_projects():
         if not projects or not action:
             return jsonify({'status': 'error', 'message': '缺少必要参数'})
         
-        results = []
-        for project in projects:
-            project_path = os.path.join(COMPOSE_ROOT, project)
-            if not os.path.exists(project_path):
-                error_msg = '项目不存在'
-                log_operation(f'deploy_{action}', project, 'error', error_msg)
-                results.append({
-                    'project': project,
-                    'status': 'error',
-                    'message': error_msg,
-                    'logs': []
-                })
-                continue
-            
-            try:
-                cmd = ['docker', 'compose']
-                if action == 'up':
-                    cmd.extend(['up', '-d'])
-                else:
-                    cmd.extend(['down'])
-                
-                logger.info(f"Executing command for {project}: {' '.join(cmd)}")
-                
-                # 执行命令并实时捕获输出
-                process = subprocess.Popen(
-                    cmd,
-                    cwd=project_path,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-                
-                # 收集日志
-                logs = []
-                while True:
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        log_line = output.strip()
-                        logs.append(log_line)
-                        logger.info(f"{project} - {log_line}")
-                
-                # 获取任剩余输出
-                stdout, stderr = process.communicate()
-                if stdout:
-                    for line in stdout.strip().split('\n'):
-                        if line:
-                            logs.append(line)
-                            logger.info(f"{project} - {line}")
-                if stderr:
-                    for line in stderr.strip().split('\n'):
-                        if line:
-                            logs.append(line)
-                            logger.error(f"{project} - {line}")
-                
-                if process.returncode == 0:
-                    success_msg = f'项目{action}成功'
-                    log_operation(f'deploy_{action}', project, 'success', success_msg)
-                    results.append({
-                        'project': project,
-                        'status': 'success',
-                        'message': success_msg,
-                        'logs': logs
-                    })
-                else:
-                    error_msg = f'项目{action}失败'
-                    log_operation(f'deploy_{action}', project, 'error', error_msg)
-                    results.append({
-                        'project': project,
-                        'status': 'error',
-                        'message': error_msg,
-                        'logs': logs
-                    })
-                    
-            except Exception as e:
-                error_msg = str(e)
-                log_operation(f'deploy_{action}', project, 'error', error_msg)
-                results.append({
+        use_prepull = action == 'up' and bool(data.get('prepull', DEPLOY_PREPULL))
+        if data.get('background'):
+            return jsonify({
+                'status': 'success',
+                'jobs': [{
                     'project': project,
-                    'status': 'error',
-                    'message': error_msg,
-                    'logs': []
-                })
+                    'job_id': job_queue.submit('deploy', project, {'action': action, 'prepull': use_prepull})['id']
+                } for project in projects]
+            })
         
-        return jsonify({
+        max_parallel = max(1, int(data.get('max_parallel', DEPLOY_PARALLEL)))
+        started = time.monotonic()
+        prepull = start_prepull(projects) if use_prepull else None
+        if max_parallel > 1 and len(projects) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_parallel, len(projects)),
+                                    thread_name_prefix='deploy') as executor:
+                results = list(executor.map(
+                    lambda project: deploy_project(project, action, prepull=prepull), projects))
+        else:
+            results = [deploy_project(project, action, prepull=prepull) for project in projects]
+        duration = round(time.monotonic() - started, 3)
+        logger.info(f"Deployed {len(projects)} projects ({action}) with max_parallel={max_parallel} in {duration}s")
+        
+        response = {
             'status': 'success',
-            'results': results
-        })
+            'results': results,
+            'max_parallel': max_parallel,
+            'duration': duration
+        }
+        if prepull:
+            response['prepull'] = prepull.summary()
+        return jsonify(response)
         
     except Exception as e:
         error_msg = str(e)
@@ -369,6 +820,79 @@ def deploy_projects():
             'message': error_msg
         })
 
+@compose_bp.route('/deploy/stream', methods=['POST'])
+def deploy_projects_stream():
+    """部署选中的项目，以 NDJSON 流实时返回输出
+
+    每行一个 JSON 对象：type=line 为某个项目的一行输出（带 project 和 stream），
+    type=result 为单个项目的结果，最后一行 type=done 为汇总。输出经有界队列转发，内存占用与输出量无关
+    """
+    data = request.json or {}
+    projects = data.get('projects', [])
+    action = data.get('action')  # 'up' 或 'down'
+    
+    if not projects or not action:
+        return jsonify({'status': 'error', 'message': '缺少必要参数'})
+    
+    max_parallel = max(1, int(data.get('max_parallel', DEPLOY_PARALLEL)))
+    use_prepull = action == 'up' and bool(data.get('prepull', DEPLOY_PREPULL))
+    events = queue.Queue(maxsize=1000)
+    cancelled = threading.Event()
+    prepull = None
+    
+    def emit(event):
+        # 客户端断开后丢弃输出，部署本身继续执行完成
+        while not cancelled.is_set():
+            try:
+                events.put(event, timeout=1)
+                return
+            except queue.Full:
+                continue
+    
+    def run_one(project):
+        result = deploy_project(project, action, on_line=lambda stream, line: emit({
+            'type': 'line',
+            'project': project,
+            'stream': stream,
+            'line': line
+        }), prepull=prepull)
+        result.pop('logs', None)
+        emit(dict(result, type='result'))
+    
+    def run_all():
+        nonlocal prepull
+        started = time.monotonic()
+        done = {'type': 'done', 'max_parallel': max_parallel}
+        try:
+            if use_prepull:
+                # 逐层拉取进度以 type=pull 事件推送
+                prepull = start_prepull(projects, on_event=lambda event: emit(dict(event, type='pull')))
+            with ThreadPoolExecutor(max_workers=min(max_parallel, len(projects)),
+                                    thread_name_prefix='deploy') as executor:
+                list(executor.map(run_one, projects))
+            if prepull:
+                done['prepull'] = prepull.summary()
+        finally:
+            duration = round(time.monotonic() - started, 3)
+            logger.info(f"Deployed {len(projects)} projects ({action}) with max_parallel={max_parallel} in {duration}s")
+            emit(dict(done, duration=duration))
+    
+    def generate():
+        threading.Thread(target=run_all, name='deploy-stream', daemon=True).start()
+        try:
+            while True:
+                event = events.get()
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+                if event['type'] == 'done':
+                    break
+        finally:
+            cancelled.set()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @compose_bp.route('/registry/config', methods=['GET'])
 def get_registry_config():
     """获取当前镜像源配置"""
@@ -501,7 +1025,8 @@ def test_registry():
 def get_projects_status():
     """获取所有项目的状态"""
     try:
-        projects = get_compose_projects()
+        container_groups = get_compose_container_groups()
+        projects = get_compose_projects(container_groups)
         status_info = [{
             'name': project['name'],
             'status': project['status'],
@@ -511,7 +1036,9 @@ def get_projects_status():
         
         return jsonify({
             'status': 'success',
-            'projects': status_info
+            'projects': status_info,
+            'orphans': find_orphan_groups(container_groups, projects),
+            'generation': project_index.generation
         })
     except Exception as e:
         return jsonify({
@@ -519,6 +1046,110 @@ def get_projects_status():
             'message': str(e)
         }) 
 
+@compose_bp.route('/projects/stats')
+def get_projects_stats():
+    """获取各项目最近一次采样的 CPU、内存和 IO 使用
+
+    只读取后台采样器的缓存，不调用 Docker；长时间无人读取时采样器暂停，恢复后第一次返回的数据可能为空或过期
+    """
+    if STATS_INTERVAL <= 0:
+        return jsonify({
+            'status': 'error',
+            'message': '资源使用采样未启用（stats_interval 为 0）'
+        })
+    try:
+        sampled_at, groups = stats_sampler.snapshot()
+        usage = {}
+        for project in project_index.entries():
+            group = find_project_group(project['name'], groups, project.get('compose_name'))
+            if group:
+                usage[project['name']] = {key: value for key, value in group.items() if key != 'working_dir'}
+        return jsonify({
+            'status': 'success',
+            'sampled_at': sampled_at,
+            'interval': STATS_INTERVAL,
+            'projects': usage,
+            'sampler': stats_sampler.overhead()
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+def find_group_project(group, projects):
+    """find_project_group 的反向查找：返回容器分组对应的项目目录"""
+    for project in projects:
+        if find_project_group(project['name'], {group['project']: group}, project.get('compose_name')):
+            return project
+    return None
+
+@compose_bp.route('/projects/events')
+def project_status_events():
+    """通过 Server-Sent Events 推送项目状态变化
+
+    连接后先发送一次完整状态（type=snapshot），之后只推送状态发生变化的项目（type=status），
+    以及项目目录的增加、删除和文件修改（type=project，event 为 added / removed / changed）
+    """
+    status_subscriber.start()
+    
+    def snapshot():
+        projects = get_compose_projects()
+        return {
+            'type': 'snapshot',
+            'generation': project_index.generation,
+            'projects': [{
+                'name': project['name'],
+                'status': project['status'],
+                'running_containers': project['running_containers'],
+                'container_count': project['container_count']
+            } for project in projects]
+        }
+    
+    def generate():
+        subscription = status_subscriber.subscribe()
+        project_watcher.attach(subscription)
+        try:
+            yield f"data: {json.dumps(snapshot())}\n\n"
+            while True:
+                try:
+                    delta = subscription.get(timeout=15)
+                except queue.Empty:
+                    # 保持连接
+                    yield ": keepalive\n\n"
+                    continue
+                
+                if delta.get('resync'):
+                    yield f"data: {json.dumps(snapshot())}\n\n"
+                    continue
+                
+                if delta.get('watch'):
+                    event = {'type': 'project', 'event': delta['watch'], 'name': delta['name']}
+                    entry = project_index.get(delta['name'])
+                    if entry:
+                        event.update(container_count=entry['container_count'], compose_name=entry['compose_name'])
+                    yield f"data: {json.dumps(event)}\n\n"
+                    continue
+                
+                project = find_group_project(delta, project_index.entries())
+                if not project:
+                    continue
+                yield "data: {}\n\n".format(json.dumps({
+                    'type': 'status',
+                    'name': project['name'],
+                    'status': 'running' if delta['running'] > 0 else 'stopped',
+                    'running_containers': delta['running'],
+                    'container_count': project['container_count']
+                }))
+        finally:
+            project_watcher.detach(subscription)
+            status_subscriber.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @compose_bp.route('/root_path', methods=['POST'])
 def save_root_path():
     """保存目录路径"""
@@ -554,6 +1185,9 @@ def save_root_path():
         # 更新全局变量
         global COMPOSE_ROOT
         COMPOSE_ROOT = new_path
+        # 为新的根目录重建项目索引，并改为监听新的根目录
+        project_index.reset(new_path)
+        project_watcher.rebind(new_path)
         
         return jsonify({
             'status': 'success',
@@ -568,9 +1202,52 @@ def save_root_path():
             'message': str(e)
         })
 
+def delete_compose_project(project, log=None, cancel=None):
+    """停止项目、删除项目目录并清理只被该项目使用的镜像，返回 (status, message)"""
+    log = log or (lambda line: None)
+    project_path = os.path.join(COMPOSE_ROOT, project)
+    if not os.path.exists(project_path):
+        return 'error', '项目不存在'
+    
+    # 1. 先停止项目
+    try:
+        log(f"正在停止项目 {project}...")
+        # 由 docker compose 停止，按依赖顺序并遵守各服务的 stop_grace_period / stop_signal
+        stop_cmd = ['docker', 'compose', 'down']
+        returncode = run_compose_command(stop_cmd, project_path, lambda stream, line: log(line), cancel)
+        if returncode != 0:
+            raise Exception("停止项目失败")
+    except Exception as e:
+        logger.error(f"Error stopping project {project}: {e}")
+        # 继续执行，因为项目可能本来就没在运行
+    if cancel and cancel.is_set():
+        raise JobCancelled()
+    
+    # 2. 删除项目目录，删除前记下项目引用的镜像
+    image_refs = collect_project_image_refs().get(project, set())
+    log(f"正在删除项目目录 {project_path}...")
+    shutil.rmtree(project_path)
+    project_index.invalidate(project)
+    deployed_configs.discard(project)
+    
+    # 3. 清理镜像：目录已删除，同时删除的其他项目不会再被当作共享者，
+    # 共享镜像由最后一个删除的项目清理
+    message = '项目删除成功'
+    try:
+        log("正在清理镜像...")
+        report = remove_project_images({project: image_refs}, log, cancel)
+        message += f"，回收 {format_bytes(report['bytes_reclaimed'])}"
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Error cleaning up images for project {project}: {e}")
+        log(f"清理镜像时出错: {str(e)}")
+    log("删除完成！")
+    return 'success', message
+
 @compose_bp.route('/delete', methods=['POST'])
 def delete_projects():
-    """删除选中的项目"""
+    """删除选中的项目（background 为真时提交为后台任务）"""
     try:
         data = request.json
         projects = data.get('projects', [])
@@ -581,67 +1258,20 @@ def delete_projects():
                 'message': '未选择要删除的项目'
             })
         
+        if data.get('background'):
+            return jsonify({
+                'status': 'success',
+                'jobs': [{
+                    'project': project,
+                    'job_id': job_queue.submit('delete', project)['id']
+                } for project in projects]
+            })
+        
         results = []
         for project in projects:
-            project_path = os.path.join(COMPOSE_ROOT, project)
             try:
-                if os.path.exists(project_path):
-                    # 1. 先停止项目
-                    try:
-                        stop_cmd = ['docker', 'compose', 'down']
-                        stop_result = subprocess.run(
-                            stop_cmd,
-                            cwd=project_path,
-                            capture_output=True,
-                            text=True
-                        )
-                        if stop_result.returncode != 0:
-                            raise Exception(f"停止项目失败: {stop_result.stderr}")
-                    except Exception as e:
-                        logger.error(f"Error stopping project {project}: {e}")
-                        # 继续执行，因为项目可能本来就没在运行
-                    
-                    # 2. 清理相关镜像
-                    try:
-                        # 获取项目使用的镜像
-                        with open(os.path.join(project_path, 'docker-compose.yml'), 'r') as f:
-                            compose_config = yaml.safe_load(f)
-                        
-                        # 收集所有服务使用的镜像
-                        images = []
-                        for service in compose_config.get('services', {}).values():
-                            if 'image' in service:
-                                images.append(service['image'])
-                        
-                        # 尝试删除镜像
-                        for image in images:
-                            try:
-                                remove_cmd = ['docker', 'rmi', image]
-                                subprocess.run(
-                                    remove_cmd,
-                                    capture_output=True,
-                                    text=True
-                                )
-                            except Exception as e:
-                                logger.error(f"Error removing image {image}: {e}")
-                                # 继续执行，因为有些镜像可能被其他项目使用
-                    except Exception as e:
-                        logger.error(f"Error cleaning up images for project {project}: {e}")
-                        # 继续执行删除项目
-                    
-                    # 3. 删除项目目录
-                    import shutil
-                    shutil.rmtree(project_path)
-                    results.append({
-                        'project': project,
-                        'status': 'success'
-                    })
-                else:
-                    results.append({
-                        'project': project,
-                        'status': 'error',
-                        'message': '项目不存在'
-                    })
+                status, message = delete_compose_project(project)
+                results.append({'project': project, 'status': status, 'message': message})
             except Exception as e:
                 results.append({
                     'project': project,
@@ -661,17 +1291,54 @@ def delete_projects():
             'message': str(e)
         }) 
 
+@compose_bp.route('/images/references')
+def get_image_references():
+    """获取镜像引用表：每个项目引用的镜像、每个镜像被哪些项目引用、每个镜像 ID 对应的容器"""
+    try:
+        image_reference_index.refresh()
+        return jsonify({'status': 'success', **image_reference_index.snapshot()})
+    except Exception as e:
+        logger.error(f"Error getting image references: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @compose_bp.route('/logs')
 def view_logs():
     """查看操作日志"""
     try:
-        # 读取操作历史
-        history_file = os.path.join(LOG_DIR, 'operation_history.json')
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
+        # 筛选条件，时间范围来自 datetime-local 输入框
+        filters = {
+            'project': request.args.get('project', '').strip(),
+            'operation': request.args.get('operation', '').strip(),
+            'status': request.args.get('status', '').strip(),
+            'start': request.args.get('start', '').strip(),
+            'end': request.args.get('end', '').strip()
+        }
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = min(500, max(1, int(request.args.get('per_page', HISTORY_PAGE_SIZE))))
+        except ValueError:
+            page, per_page = 1, HISTORY_PAGE_SIZE
+        start = filters['start'].replace('T', ' ')
+        end = filters['end'].replace('T', ' ')
+        if len(end) == 16:
+            # 结束时间精确到分钟，包含该分钟内的记录
+            end += ':59'
+
+        history, total = operation_history.query(
+            project=filters['project'],
+            operation=filters['operation'],
+            status=filters['status'],
+            start=start or None,
+            end=end or None,
+            limit=per_page,
+            offset=(page - 1) * per_page
+        )
+        pagination = {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': max(1, (total + per_page - 1) // per_page)
+        }
         
         # 获取日志文件列表
         log_files = []
@@ -686,6 +1353,13 @@ def view_logs():
         return render_template(
             'compose_logs.html',
             history=history,
+            filters=filters,
+            filter_options={
+                'project': operation_history.distinct('project'),
+                'operation': operation_history.distinct('operation'),
+                'status': operation_history.distinct('status')
+            },
+            pagination=pagination,
             log_files=sorted(log_files, reverse=True),
             lang=lang,
             current_lang=current_lang,
@@ -696,26 +1370,191 @@ def view_logs():
         logger.error(f"Error viewing logs: {e}")
         return str(e), 500
 
+def resolve_log_path(filename):
+    """返回日志目录下的文件路径，文件名不合法或文件不存在时返回 None"""
+    if os.path.basename(filename) != filename or not filename.endswith('.log'):
+        return None
+    log_path = os.path.join(LOG_DIR, filename)
+    return log_path if os.path.isfile(log_path) else None
+
 @compose_bp.route('/logs/file/<filename>')
 def get_log_file(filename):
-    """获取日志文件内容"""
+    """获取日志文件内容
+
+    默认返回最后 LOG_TAIL_LINES 行；?lines=N 返回最后 N 行，配合 before=偏移 向前翻页；
+    ?offset=N&length=M 按字节范围读取；也支持标准的 Range 请求头。
+    响应头 X-Log-Start/X-Log-End/X-Log-Size 给出本次内容的字节范围和文件大小
+    """
     try:
-        log_path = os.path.join(LOG_DIR, filename)
-        if not os.path.exists(log_path):
+        log_path = resolve_log_path(filename)
+        if not log_path:
             return '日志文件不存在', 404
-            
-        with open(log_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        return content
         
+        if request.range:
+            return send_file(log_path, mimetype='text/plain', conditional=True)
+        
+        if 'offset' in request.args:
+            offset = int(request.args['offset'])
+            length = min(int(request.args.get('length', LOG_MAX_READ)), LOG_MAX_READ)
+            content, start, end, size = read_range(log_path, offset, length)
+        else:
+            lines = min(int(request.args.get('lines', LOG_TAIL_LINES)), LOG_MAX_LINES)
+            before = request.args.get('before', type=int)
+            content, start, end, size = tail_lines(log_path, lines, before)
+        
+        return Response(content, mimetype='text/plain', headers={
+            'X-Log-Start': str(start),
+            'X-Log-End': str(end),
+            'X-Log-Size': str(size),
+            'Cache-Control': 'no-cache'
+        })
+        
+    except ValueError as e:
+        return str(e), 400
     except Exception as e:
         logger.error(f"Error reading log file {filename}: {e}")
         return str(e), 500
 
+@compose_bp.route('/logs/file/<filename>/follow')
+def follow_log_file(filename):
+    """通过 Server-Sent Events 推送日志文件新追加的行
+
+    从 ?offset=N（或断线重连时的 Last-Event-ID）开始，默认从文件末尾开始；
+    每次只读取新增的字节，事件 id 为读取后的偏移
+    """
+    log_path = resolve_log_path(filename)
+    if not log_path:
+        return '日志文件不存在', 404
+    
+    offset = request.headers.get('Last-Event-ID', request.args.get('offset'))
+    try:
+        offset = int(offset) if offset is not None else os.path.getsize(log_path)
+    except ValueError:
+        return '无效的偏移', 400
+    
+    def generate():
+        position = offset
+        idle = 0
+        while True:
+            try:
+                lines, position = read_new_lines(log_path, position, LOG_MAX_READ)
+            except OSError as e:
+                yield "data: {}\n\n".format(json.dumps({'type': 'error', 'message': str(e)}))
+                return
+            if lines:
+                idle = 0
+                yield "id: {}\ndata: {}\n\n".format(position, json.dumps({
+                    'type': 'lines',
+                    'lines': lines,
+                    'offset': position
+                }, ensure_ascii=False))
+                continue
+            idle += LOG_FOLLOW_INTERVAL
+            if idle >= 15:
+                # 保持连接
+                idle = 0
+                yield ": keepalive\n\n"
+            time.sleep(LOG_FOLLOW_INTERVAL)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@compose_bp.route('/logs/search')
+def search_logs():
+    """在 compose 和 docker-manager 日志中搜索
+
+    参数: q 关键字（空格分隔，全部匹配），level，project，
+    days 最近天数或 start/end 时间范围，page/per_page 分页
+    """
+    try:
+        started = time.time()
+        start = request.args.get('start', '').replace('T', ' ')
+        end = request.args.get('end', '').replace('T', ' ')
+        days = request.args.get('days', type=float)
+        if days:
+            start = datetime.fromtimestamp(time.time() - days * 86400).strftime('%Y-%m-%d %H:%M:%S')
+        if len(end) == 16:
+            end += ':59'
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = min(500, max(1, request.args.get('per_page', 100, type=int)))
+        
+        results, total = log_search_index.search(
+            query=request.args.get('q', '').strip(),
+            level=request.args.get('level', '').strip(),
+            project=request.args.get('project', '').strip(),
+            start=start or None,
+            end=end or None,
+            limit=per_page,
+            offset=(page - 1) * per_page
+        )
+        return jsonify({
+            'status': 'success',
+            'results': results,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'duration': round(time.time() - started, 3)
+        })
+    except Exception as e:
+        logger.error(f"Error searching logs: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def collect_project_image_refs():
+    """返回 COMPOSE_ROOT 下每个项目引用的镜像 {项目: 镜像引用集合}"""
+    image_reference_index.refresh()
+    return image_reference_index.project_refs()
+
+def remove_project_images(target_refs, log, cancel=None):
+    """删除只被目标项目使用的镜像，返回清理报告
+
+    target_refs 为 {目标项目: 镜像引用集合}，其余项目的引用从项目索引中获取
+    """
+    project_refs = collect_project_image_refs()
+    project_refs.update(target_refs)
+    planner = ImageRemovalPlanner(shared_client.get(), max_workers=IMAGE_REMOVE_WORKERS)
+    report = planner.run(set(target_refs), project_refs, log, cancel)
+    if cancel and cancel.is_set():
+        raise JobCancelled()
+    return report
+
+def cleanup_compose_project(project_name, log, cancel=None):
+    """停止项目并清理相关镜像，输出逐行回调 log(line)，返回 (status, message)"""
+    project_path = os.path.join(COMPOSE_ROOT, project_name)
+    if not os.path.exists(project_path):
+        return 'error', '项目不存在'
+    
+    try:
+        # 1. 停止项目
+        log(f"正在停止项目 {project_name}...")
+        # 由 docker compose 停止，按依赖顺序并遵守各服务的 stop_grace_period / stop_signal
+        stop_cmd = ['docker', 'compose', 'down']
+        returncode = run_compose_command(stop_cmd, project_path, lambda stream, line: log(line), cancel)
+        if cancel and cancel.is_set():
+            raise JobCancelled()
+        if returncode != 0:
+            raise Exception("停止项目失败")
+        deployed_configs.discard(project_name)
+        
+        # 2. 清理只被本项目使用的镜像
+        log("\n正在清理镜像...")
+        image_refs = collect_project_image_refs().get(project_name, set())
+        report = remove_project_images({project_name: image_refs}, log, cancel)
+        
+        log("\n清理完成！")
+        return 'success', f"项目清理成功，回收 {format_bytes(report['bytes_reclaimed'])}"
+        
+    except JobCancelled:
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        log(f"\n操作失败: {error_msg}")
+        return 'error', error_msg
+
 @compose_bp.route('/cleanup', methods=['POST'])
 def cleanup_project():
-    """停止项目并清理相关镜像"""
+    """停止项目并清理相关镜像（background 为真时提交为后台任务）"""
     try:
         data = request.json
         project_name = data.get('project')
@@ -732,69 +1571,22 @@ def cleanup_project():
                 'status': 'error',
                 'message': '项目不存在'
             })
-            
-        logs = []
         
-        try:
-            # 1. 停止项目
-            logs.append(f"正在停止项目 {project_name}...")
-            stop_cmd = ['docker', 'compose', 'down']
-            stop_result = subprocess.run(
-                stop_cmd,
-                cwd=project_path,
-                capture_output=True,
-                text=True
-            )
-            logs.extend(stop_result.stdout.splitlines())
-            if stop_result.stderr:
-                logs.extend(stop_result.stderr.splitlines())
-            
-            if stop_result.returncode != 0:
-                raise Exception("停止项目失败")
-            
-            # 2. 获取项目使用的镜像
-            logs.append("\n正在获取项目镜像...")
-            with open(os.path.join(project_path, 'docker-compose.yml'), 'r') as f:
-                compose_config = yaml.safe_load(f)
-            
-            # 收集所有服务使用的镜像
-            images = []
-            for service in compose_config.get('services', {}).values():
-                if 'image' in service:
-                    images.append(service['image'])
-            
-            # 3. 删除相关镜像
-            logs.append("\n正在清理镜像...")
-            for image in images:
-                try:
-                    remove_cmd = ['docker', 'rmi', image]
-                    remove_result = subprocess.run(
-                        remove_cmd,
-                        capture_output=True,
-                        text=True
-                    )
-                    logs.extend(remove_result.stdout.splitlines())
-                    if remove_result.stderr:
-                        logs.extend(remove_result.stderr.splitlines())
-                except Exception as e:
-                    logs.append(f"清理镜像 {image} 时出错: {str(e)}")
-            
-            logs.append("\n清理完成！")
-            
+        if data.get('background'):
+            job = job_queue.submit('cleanup', project_name)
             return jsonify({
                 'status': 'success',
-                'message': '项目清理成功',
-                'logs': logs
+                'message': '清理任务已提交',
+                'job_id': job['id']
             })
             
-        except Exception as e:
-            error_msg = str(e)
-            logs.append(f"\n操作失败: {error_msg}")
-            return jsonify({
-                'status': 'error',
-                'message': error_msg,
-                'logs': logs
-            })
+        logs = []
+        status, message = cleanup_compose_project(project_name, logs.append)
+        return jsonify({
+            'status': status,
+            'message': message,
+            'logs': logs
+        })
             
     except Exception as e:
         return jsonify({
@@ -843,7 +1635,7 @@ def create_project():
         
         try:
             # 验证 YAML 格式
-            compose_config = yaml.safe_load(compose_content)
+            compose_config = parse_compose(compose_content)
             
             # 验证服务配置
             if not isinstance(compose_config, dict) or 'services' not in compose_config:
@@ -884,27 +1676,29 @@ def create_project():
 
         # 如果选择了创建后运行，部署项目
         logs = []
+        use_prepull = bool(data.get('prepull', DEPLOY_PREPULL))
+        if run_after_create and data.get('background'):
+            job = job_queue.submit('deploy', project_name, {'action': 'up', 'prepull': use_prepull})
+            return jsonify({
+                'status': 'success',
+                'message': '项目创建成功',
+                'logs': logs,
+                'job_id': job['id']
+            })
         if run_after_create:
-            try:
-                logs.append(f"正在启动项目 {project_name}...")
-                # 使用最新保存的配置文件部署项目
-                cmd = ['docker', 'compose', 'up', '-d']
-                result = subprocess.run(
-                    cmd,
-                    cwd=project_path,
-                    capture_output=True,
-                    text=True
-                )
-                logs.extend(result.stdout.splitlines())
-                if result.stderr:
-                    logs.extend(result.stderr.splitlines())
-                
-                if result.returncode == 0:
-                    logs.append("\n项目启动成功！")
-                else:
-                    logs.append("\n项目启动失败！")
-            except Exception as e:
-                logs.append(f"\n启动出错: {str(e)}")
+            logs.append(f"正在启动项目 {project_name}...")
+            prepull = start_prepull([project_name]) if use_prepull else None
+            # 使用最新保存的配置文件部署项目
+            result = deploy_project(project_name, 'up', prepull=prepull)
+            logs.extend(result['logs'])
+            if result['status'] == 'success':
+                logs.append("\n项目启动成功！")
+            else:
+                logs.append(f"\n项目启动失败！{result['message']}")
+            if prepull:
+                summary = prepull.summary()
+                logs.append(f"预拉取 {summary['pulled']} 个镜像，耗时 {summary['duration']}s，"
+                            f"比逐个拉取节省 {summary['saved']}s")
         
         return jsonify({
             'status': 'success',
@@ -920,6 +1714,131 @@ def create_project():
             'message': error_msg
         })
 
+def run_deploy_job(job, log, cancelled):
+    """后台任务：部署项目"""
+    action = job['params'].get('action', 'up')
+    prepull = None
+    if action == 'up' and job['params'].get('prepull'):
+        prepull = start_prepull([job['project']], on_event=lambda event: log(describe_pull_event(event)),
+                                cancel=cancelled)
+    result = deploy_project(job['project'], action,
+                            on_line=lambda stream, line: log(line, stream), cancel=cancelled, prepull=prepull)
+    if prepull:
+        summary = prepull.summary()
+        log(f"预拉取 {summary['pulled']} 个镜像，耗时 {summary['duration']}s，"
+            f"比逐个拉取节省 {summary['saved']}s")
+    return result['status'], result['message']
+
+def run_redeploy_job(job, log, cancelled):
+    """后台任务：只重新部署配置变化的服务"""
+    result = redeploy_project(job['project'], on_line=lambda stream, line: log(line, stream), cancel=cancelled)
+    if result.get('recreated'):
+        log(f"重建的服务: {', '.join(result['recreated'])}")
+    return result['status'], result['message']
+
+def run_cleanup_job(job, log, cancelled):
+    """后台任务：停止项目并清理镜像"""
+    status, message = cleanup_compose_project(job['project'], log, cancelled)
+    log_operation('cleanup', job['project'], status, message)
+    return status, message
+
+def run_delete_job(job, log, cancelled):
+    """后台任务：删除项目"""
+    status, message = delete_compose_project(job['project'], log, cancelled)
+    log_operation('delete_project', job['project'], status, message)
+    return status, message
+
+job_queue.register('deploy', run_deploy_job)
+job_queue.register('redeploy', run_redeploy_job)
+job_queue.register('cleanup', run_cleanup_job)
+job_queue.register('delete', run_delete_job)
+
+@compose_bp.before_app_first_request
+def start_job_queue():
+    """在处理第一个请求时启动任务队列，继续执行重启前未完成排队的任务"""
+    job_queue.start()
+    # 同时开始在后台增量索引日志文件，并监听项目目录的变化
+    log_search_index.start()
+    project_watcher.start(COMPOSE_ROOT)
+    if STATS_INTERVAL > 0:
+        stats_sampler.start()
+
+@compose_bp.route('/jobs')
+def list_jobs():
+    """获取最近的后台任务"""
+    try:
+        limit = int(request.args.get('limit', 100))
+        return jsonify({
+            'status': 'success',
+            'jobs': job_queue.list(limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+@compose_bp.route('/jobs/stats')
+def get_job_stats():
+    """获取任务队列的吞吐量和排队延迟"""
+    return jsonify({
+        'status': 'success',
+        'stats': job_queue.stats()
+    })
+
+@compose_bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    """获取单个任务的状态"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'status': 'error',
+            'message': '任务不存在'
+        })
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
+@compose_bp.route('/jobs/<job_id>/logs')
+def get_job_logs(job_id):
+    """从 offset 开始读取任务输出，返回新的 offset 供下次增量读取"""
+    try:
+        job = job_queue.get(job_id)
+        if not job:
+            return jsonify({
+                'status': 'error',
+                'message': '任务不存在'
+            })
+        offset = max(0, int(request.args.get('offset', 0)))
+        content, offset = job_queue.read_log(job_id, offset)
+        return jsonify({
+            'status': 'success',
+            'state': job['state'],
+            'message': job['message'],
+            'content': content,
+            'offset': offset
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+@compose_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务"""
+    job = job_queue.cancel(job_id)
+    if not job:
+        return jsonify({
+            'status': 'error',
+            'message': '任务不存在'
+        })
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
 # 添加新的函数来获取当前 Docker 镜像源配置
 def get_current_docker_registry():
     """获取当前 Docker 镜像源配置"""
@@ -1098,7 +2017,7 @@ def convert_compose_to_run():
         
         # 解析 YAML
         try:
-            compose_config = yaml.safe_load(compose_yaml)
+            compose_config = parse_compose(compose_yaml)
         except yaml.YAMLError as e:
             return jsonify({
                 'status': 'error',
@@ -1260,9 +2179,16 @@ def convert_compose_to_run():
 
 @compose_bp.route('/directories')
 def list_directories():
-    """列出目录"""
+    """分页列出目录下的子目录
+
+    参数 prefix 按前缀过滤，cursor 为上一页返回的 next_cursor，limit 为每页数量；
+    最近浏览过的目录在短时间内直接使用缓存
+    """
     try:
         path = request.args.get('path', '/')
+        prefix = request.args.get('prefix', '').strip()
+        cursor = request.args.get('cursor') or None
+        limit = min(max(1, request.args.get('limit', DIRECTORY_PAGE_SIZE, type=int)), DIRECTORY_MAX_PAGE_SIZE)
         
         # 规范化路径
         path = os.path.normpath(path)
@@ -1275,23 +2201,22 @@ def list_directories():
             parent_path = '/'
             
         # 获取目录列表
-        directories = []
         try:
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    directories.append(item)
+            names = directory_cache.get(path)
         except PermissionError:
             return jsonify({
                 'status': 'error',
                 'message': '没有权限访问该目录'
             })
+        directories, next_cursor, total = paginate(names, cursor, limit, prefix)
             
         return jsonify({
             'status': 'success',
             'current_path': path,
             'parent_path': parent_path,
-            'directories': sorted(directories)
+            'directories': directories,
+            'next_cursor': next_cursor,
+            'total': total
         })
         
     except Exception as e:
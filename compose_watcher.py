@@ -0,0 +1,308 @@
+import os
+import time
+import queue
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+import logging
+from compose_index import COMPOSE_FILENAMES, ENV_FILENAME, IGNORE_FILENAME
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.watcher')
+
+# inotify 事件掩码（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+ROOT_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+PROJECT_MASK = IN_CLOSE_WRITE | IN_MODIFY | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# 不会投递 inotify 事件的网络和用户态文件系统，使用轮询
+POLL_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'afs', 'ceph', 'glusterfs', 'sshfs', 'davfs')
+
+# 变化需要反映到项目索引的文件
+WATCHED_FILES = set(COMPOSE_FILENAMES) | {ENV_FILENAME}
+
+def filesystem_type(path):
+    """从 /proc/mounts 中找出路径所在的文件系统类型，无法确定时返回 None"""
+    try:
+        with open('/proc/mounts', 'r') as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        mount_point = fields[1].replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best):
+            best, fstype = mount_point, fields[2]
+    return fstype
+
+class Inotify:
+    """通过 ctypes 调用 libc 的 inotify 接口，不可用时构造函数抛出 OSError"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify 不可用')
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read(self, timeout):
+        """等待至多 timeout 秒，返回 [(wd, mask, name)]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + length].rstrip(b'\0'))
+            position += length
+            events.append((wd, mask, name))
+        return events
+
+    def rm_watch(self, wd):
+        # 目录已删除时内核已自动移除监听，忽略返回的错误
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def close(self):
+        os.close(self.fd)
+
+class ComposeRootWatcher:
+    """监听 COMPOSE_ROOT 下项目的增加、删除和 compose/.env 文件的修改
+
+    Linux 上使用 inotify 监听根目录和项目索引扫描到的每个目录（递归发现时包括分组目录），收到事件后只使对应项目的索引缓存失效；
+    网络文件系统（不投递 inotify 事件）或 inotify 不可用时按 poll_interval 秒轮询，
+    依靠项目索引的 (path, mtime, size) 键发现变化。每次刷新后比较项目索引，
+    把 added / removed / changed 事件推送给所有订阅队列。根目录变化时调用 rebind 重新监听。
+    """
+
+    def __init__(self, index, mode='auto', poll_interval=5, debounce=0.2, workers=1):
+        self._index = index
+        self._mode = mode
+        self._poll_interval = poll_interval
+        self._debounce = debounce
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._root = None
+        self._thread = None
+        self._rebind = threading.Event()
+        self._stop = threading.Event()
+        # 当前实际使用的监听方式：inotify / poll
+        self.backend = None
+
+    def start(self, root):
+        """开始监听根目录（重复调用时等同于 rebind）"""
+        if self._mode == 'off':
+            return
+        with self._lock:
+            self._root = root
+            if self._thread and self._thread.is_alive():
+                self._rebind.set()
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='compose-watcher', daemon=True)
+            self._thread.start()
+
+    def rebind(self, root):
+        """切换到新的根目录，旧目录的监听全部释放"""
+        with self._lock:
+            self._root = root
+            self._rebind.set()
+
+    def stop(self):
+        self._stop.set()
+        self._rebind.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def attach(self, q):
+        """把订阅队列加入推送列表，事件格式为 {'watch': 'added'|'removed'|'changed', 'name': 项目名}"""
+        with self._lock:
+            self._subscribers.append(q)
+
+    def detach(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._rebind.clear()
+            with self._lock:
+                root = self._root
+            try:
+                # 先同步一次索引，之后的事件都相对于这一刻
+                self._index.refresh(root, workers=self._workers)
+                if self._use_inotify(root):
+                    self._watch_inotify(root)
+                else:
+                    self._watch_poll(root)
+            except Exception as e:
+                logger.error(f"Error watching {root}, retrying in {self._poll_interval}s: {e}")
+                self._rebind.wait(self._poll_interval)
+
+    def _use_inotify(self, root):
+        if self._mode == 'poll':
+            return False
+        fstype = filesystem_type(root)
+        if self._mode == 'auto' and fstype and (fstype in POLL_FILESYSTEMS or fstype.startswith('fuse')):
+            logger.info(f"{root} is on {fstype}, watching by polling every {self._poll_interval}s")
+            return False
+        return True
+
+    def _watch_poll(self, root):
+        self.backend = 'poll'
+        while not self._rebind.wait(self._poll_interval):
+            self._sync(root)
+
+    def _watch_inotify(self, root):
+        try:
+            inotify = Inotify()
+        except OSError as e:
+            logger.info(f"inotify unavailable, watching {root} by polling: {e}")
+            return self._watch_poll(root)
+        try:
+            root_wd = inotify.add_watch(root, ROOT_MASK)
+            # wd -> 目录相对路径，包括项目目录和递归发现时经过的普通目录
+            watches = {}
+            self._update_watches(inotify, root, watches)
+            self.backend = 'inotify'
+            logger.info(f"Watching {root} with inotify ({len(watches)} directories)")
+            # 收到事件后再等待 debounce 秒合并同一批写入，只刷新受影响的项目
+            while not self._rebind.is_set():
+                events = inotify.read(1)
+                if not events:
+                    continue
+                deadline = time.monotonic() + self._debounce
+                while time.monotonic() < deadline:
+                    events.extend(inotify.read(max(0, deadline - time.monotonic())))
+                affected, full = self._affected(root_wd, watches, events)
+                if full is True:
+                    # 根目录被删除或移动，等待重新绑定或重试
+                    raise OSError(f'{root} 已被删除或移动')
+                self._sync(root, None if full else affected)
+                self._update_watches(inotify, root, watches)
+        finally:
+            inotify.close()
+
+    def _update_watches(self, inotify, root, watches):
+        """使监听的目录与项目索引最近一次扫描到的目录一致"""
+        wanted = set(self._index.directories())
+        # 先移除再添加：目录改名后内核对同一 inode 返回原来的 wd
+        for wd, path in list(watches.items()):
+            if path not in wanted:
+                watches.pop(wd)
+                inotify.rm_watch(wd)
+        current = set(watches.values())
+        for path in sorted(wanted - current):
+            try:
+                watches[inotify.add_watch(os.path.join(root, path), PROJECT_MASK)] = path
+            except OSError as e:
+                # 监听数量达到 fs.inotify.max_user_watches 等情况，该目录依靠上级目录的事件发现变化
+                logger.error(f"Error watching directory {path}: {e}")
+
+    def _affected(self, root_wd, watches, events):
+        """从一批事件中找出受影响的项目或目录，返回 (相对路径集合, 是否需要全量刷新)
+
+        根目录被删除或移动时第二项为 True，事件队列溢出或忽略规则变化时为 'rescan'
+        """
+        projects = set(self._index.signatures())
+        affected = set()
+        full = False
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                full = full or 'rescan'
+                continue
+            if wd == root_wd:
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    full = True
+                    continue
+                path = ''
+            elif wd in watches:
+                if mask & IN_IGNORED:
+                    watches.pop(wd)
+                    continue
+                path = watches[wd]
+            else:
+                continue
+            if name == IGNORE_FILENAME:
+                full = full or 'rescan'
+            elif mask & IN_ISDIR:
+                # 项目内部的子目录（如数据卷）与项目发现无关
+                if name and path not in projects:
+                    affected.add(f'{path}/{name}' if path else name)
+            elif name in WATCHED_FILES and path:
+                affected.add(path)
+        return affected, full
+
+    def _sync(self, root, affected=None):
+        """刷新项目索引并推送变化，affected 为 None 时不做失效、只按文件键检查"""
+        if self._rebind.is_set():
+            # 根目录已切换，不再刷新旧目录
+            return
+        before = self._index.signatures()
+        if affected:
+            for name in affected:
+                self._index.invalidate(name)
+        self._index.refresh(root, workers=self._workers)
+        after = self._index.signatures()
+        events = [{'watch': 'added', 'name': name} for name in sorted(set(after) - set(before))]
+        events += [{'watch': 'removed', 'name': name} for name in sorted(set(before) - set(after))]
+        events += [
+            {'watch': 'changed', 'name': name}
+            for name in sorted(set(before) & set(after)) if before[name] != after[name]
+        ]
+        if events:
+            changes = ', '.join(f"{event['watch']} {event['name']}" for event in events)
+            logger.info(f"Project changes under {root}: {changes}")
+            self._publish(events)
+
+    def _publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            for event in events:
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    # 与状态订阅相同：订阅者消费过慢时改为通知其重新获取完整状态
+                    while True:
+                        try:
+                            q.get_nowait()
+                        except queue.Empty:
+                            break
+                    q.put_nowait({'resync': True})
+                    break
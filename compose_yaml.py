@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+import yaml
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.yaml')
+
+# libyaml 可用时使用 C 实现的解析器，否则退回纯 Python 实现，两者解析结果相同
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+YAML_ACCELERATED = SafeLoader is not yaml.SafeLoader
+
+def load_yaml(content):
+    """解析 YAML（不缓存），格式错误时抛出 yaml.YAMLError"""
+    return yaml.load(content, Loader=SafeLoader)
+
+class YamlParseCache:
+    """按内容哈希缓存 YAML 解析结果，超过 max_entries 时淘汰最久未使用的条目
+
+    同一份未修改的 compose 文件在项目索引、镜像引用、配置差异等流程中会被多次解析，
+    命中缓存时只需计算一次哈希。格式错误同样缓存，内容不变时直接抛出同一异常。
+    返回的对象在调用方之间共享，调用方不能修改
+    """
+
+    def __init__(self, max_entries=512):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, content):
+        """解析 YAML 内容，格式错误时抛出 yaml.YAMLError"""
+        key = hashlib.sha1((content or '').encode('utf-8')).digest()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if cached is None:
+            try:
+                cached = (load_yaml(content or ''), None)
+            except yaml.YAMLError as e:
+                cached = (None, e)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = cached
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        data, error = cached
+        if error is not None:
+            # 同一异常对象重复抛出时不累积 traceback
+            raise error.with_traceback(None)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self._max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'accelerated': YAML_ACCELERATED
+            }
+
+# 全局解析缓存
+yaml_cache = YamlParseCache()
+
+def parse_compose(content):
+    """解析 compose 文件内容（带缓存），返回的对象不能修改"""
+    return yaml_cache.parse(content)
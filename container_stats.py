@@ -0,0 +1,248 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import docker
+from docker.utils import version_lt
+from compose_events import COMPOSE_PROJECT_LABEL, COMPOSE_WORKING_DIR_LABEL
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.stats')
+
+def memory_usage(stats):
+    """容器实际使用的内存：与 docker stats 相同，扣除可回收的页缓存"""
+    memory = stats.get('memory_stats') or {}
+    usage = memory.get('usage')
+    if usage is None:
+        return None, memory.get('limit')
+    detail = memory.get('stats') or {}
+    # cgroup v2 为 inactive_file，cgroup v1 为 total_inactive_file
+    cache = detail.get('inactive_file', detail.get('total_inactive_file', 0))
+    return max(0, usage - cache), memory.get('limit')
+
+def block_io(stats):
+    """返回容器启动以来累计的块设备 (读, 写) 字节数"""
+    read = write = 0
+    for entry in (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = (entry.get('op') or '').lower()
+        if op == 'read':
+            read += entry.get('value', 0)
+        elif op == 'write':
+            write += entry.get('value', 0)
+    return read, write
+
+def network_io(stats):
+    """返回容器启动以来累计的网络 (接收, 发送) 字节数"""
+    rx = tx = 0
+    for interface in (stats.get('networks') or {}).values():
+        rx += interface.get('rx_bytes', 0)
+        tx += interface.get('tx_bytes', 0)
+    return rx, tx
+
+def cpu_counters(stats):
+    """返回 (容器 CPU 时间, 主机 CPU 时间, CPU 数)，缺少数据时返回 None"""
+    cpu = stats.get('cpu_stats') or {}
+    total = (cpu.get('cpu_usage') or {}).get('total_usage')
+    system = cpu.get('system_cpu_usage')
+    if total is None or system is None:
+        return None
+    online = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+    return total, system, online
+
+def cpu_percent(current, previous):
+    """按两次采样之间的 CPU 时间计算使用率，与 docker stats 相同（100% 表示占满一个核）"""
+    if not current or not previous:
+        return None
+    container_delta = current[0] - previous[0]
+    system_delta = current[1] - previous[1]
+    if container_delta < 0 or system_delta <= 0:
+        return None
+    return container_delta / system_delta * current[2] * 100.0
+
+class ContainerStatsSampler:
+    """后台定时采集运行中 compose 容器的资源使用，并按项目标签汇总
+
+    每 interval 秒用至多 workers 个线程并发获取一次各容器的 stats，结果缓存在内存中，
+    页面和接口只读取缓存，不会触发 Docker 调用。API 版本支持时使用 one-shot 请求
+    （守护进程无需等待两个采样周期），CPU 使用率和 IO 速率由相邻两次采样计算。
+    超过 idle_timeout 秒没有读取时暂停采样，下次读取时恢复。
+    每次采样的耗时和本进程消耗的 CPU 时间记录在 overhead() 中
+    """
+
+    def __init__(self, client_source, interval=10, workers=4, idle_timeout=300):
+        self._client_source = client_source
+        self.interval = interval
+        self._workers = workers
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_read = 0
+        # 容器 ID -> 上一次采样的原始计数器
+        self._previous = {}
+        self._projects = {}
+        self._sampled_at = None
+        self._overhead = {
+            'samples': 0,
+            'containers': 0,
+            'errors': 0,
+            'duration': None,
+            'cpu_time': None,
+            'total_duration': 0.0,
+            'total_cpu_time': 0.0
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='container-stats', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def snapshot(self):
+        """返回最近一次采样的 (采样时间, {项目标签: 汇总})，并在暂停时唤醒采样线程"""
+        with self._lock:
+            idle = time.monotonic() - self._last_read > self._idle_timeout
+            self._last_read = time.monotonic()
+            result = self._sampled_at, self._projects
+        if idle:
+            self._wake.set()
+        return result
+
+    def overhead(self):
+        """采样器自身的开销统计"""
+        with self._lock:
+            overhead = dict(self._overhead)
+        samples = overhead['samples']
+        overhead.update(
+            interval=self.interval,
+            workers=self._workers,
+            average_duration=overhead['total_duration'] / samples if samples else None,
+            # 采样耗时占采样间隔的比例
+            duty_cycle=overhead['duration'] / self.interval if overhead['duration'] is not None else None,
+            idle=time.monotonic() - self._last_read > self._idle_timeout
+        )
+        return overhead
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                idle = time.monotonic() - self._last_read > self._idle_timeout
+            if idle:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            started = time.monotonic()
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"Error sampling container stats: {e}")
+            # 采样本身耗时超过间隔时不重叠执行，下一次紧接着开始
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def _sample(self):
+        started = time.monotonic()
+        thread_started = time.thread_time()
+        client = self._client_source()
+        containers = client.api.containers(filters={'label': COMPOSE_PROJECT_LABEL, 'status': 'running'})
+        one_shot = True if not version_lt(client.api.api_version, '1.41') else None
+
+        def fetch(container):
+            cpu_started = time.thread_time()
+            try:
+                stats = client.api.stats(container['Id'], stream=False, one_shot=one_shot)
+                return container, stats, time.thread_time() - cpu_started
+            except docker.errors.NotFound:
+                # 采样期间容器已停止或删除
+                return container, None, time.thread_time() - cpu_started
+            except Exception as e:
+                # 单个容器超时或连接中断只计为错误，不影响其他容器的汇总
+                logger.error(f"Error getting stats for container {container['Id'][:12]}: {e}")
+                return container, None, time.thread_time() - cpu_started
+
+        results = []
+        if containers:
+            with ThreadPoolExecutor(max_workers=min(self._workers, len(containers)),
+                                    thread_name_prefix='container-stats') as executor:
+                # fetch 自行处理所有异常，一个容器出错不会中断其余结果的收集
+                results = list(executor.map(fetch, containers))
+
+        now = time.time()
+        projects = {}
+        previous = {}
+        errors = 0
+        cpu_time = 0.0
+        for container, stats, used in results:
+            cpu_time += used
+            if stats is None:
+                errors += 1
+                continue
+            counters = {
+                'time': time.monotonic(),
+                'cpu': cpu_counters(stats),
+                'block': block_io(stats),
+                'net': network_io(stats)
+            }
+            if not one_shot:
+                # 旧版本 API 由守护进程等待两个周期后返回 precpu_stats
+                percent = cpu_percent(counters['cpu'], cpu_counters({'cpu_stats': stats.get('precpu_stats')}))
+            else:
+                percent = cpu_percent(counters['cpu'], (self._previous.get(container['Id']) or {}).get('cpu'))
+            previous[container['Id']] = counters
+            memory, limit = memory_usage(stats)
+            labels = container.get('Labels') or {}
+            project = projects.setdefault(labels.get(COMPOSE_PROJECT_LABEL), {
+                'working_dir': labels.get(COMPOSE_WORKING_DIR_LABEL),
+                'containers': 0,
+                'cpu_percent': None,
+                'memory_usage': 0,
+                'memory_limit': 0,
+                'block_read': 0,
+                'block_write': 0,
+                'block_read_rate': None,
+                'block_write_rate': None,
+                'net_rx': 0,
+                'net_tx': 0
+            })
+            project['containers'] += 1
+            if percent is not None:
+                project['cpu_percent'] = (project['cpu_percent'] or 0) + percent
+            project['memory_usage'] += memory or 0
+            # 各容器通常共享主机内存上限，取最大值而不是相加
+            project['memory_limit'] = max(project['memory_limit'], limit or 0)
+            project['block_read'] += counters['block'][0]
+            project['block_write'] += counters['block'][1]
+            project['net_rx'] += counters['net'][0]
+            project['net_tx'] += counters['net'][1]
+            last = self._previous.get(container['Id'])
+            if last and counters['time'] > last['time']:
+                elapsed = counters['time'] - last['time']
+                read_rate = max(0, counters['block'][0] - last['block'][0]) / elapsed
+                write_rate = max(0, counters['block'][1] - last['block'][1]) / elapsed
+                project['block_read_rate'] = (project['block_read_rate'] or 0) + read_rate
+                project['block_write_rate'] = (project['block_write_rate'] or 0) + write_rate
+
+        duration = time.monotonic() - started
+        # 采样线程自身（列出容器和汇总）加上各工作线程获取 stats 的 CPU 时间
+        cpu_time += time.thread_time() - thread_started
+        with self._lock:
+            # 只保留本次仍在运行的容器，停止的容器不再参与下次计算
+            self._previous = previous
+            self._projects = projects
+            self._sampled_at = now
+            overhead = self._overhead
+            overhead['samples'] += 1
+            overhead['containers'] = len(containers)
+            overhead['errors'] = errors
+            overhead['duration'] = duration
+            overhead['cpu_time'] = cpu_time
+            overhead['total_duration'] += duration
+            overhead['total_cpu_time'] += cpu_time
@@ -0,0 +1,66 @@
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+def scan_directories(path):
+    """列出 path 下的子目录名（已排序）
+
+    使用 os.scandir 返回的文件类型判断是否为目录，只有符号链接和文件系统不提供类型时才需要额外 stat
+    """
+    names = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    names.append(entry.name)
+            except OSError:
+                # 失效的符号链接等
+                continue
+    names.sort()
+    return names
+
+class DirectoryListingCache:
+    """最近浏览过的目录列表的短期缓存
+
+    条目在 ttl 秒内且目录 mtime 未变化时直接复用，来回浏览时不再重新列出目录；
+    最多保留 max_entries 个目录，超出时淘汰最久未使用的条目
+    """
+
+    def __init__(self, ttl=30, max_entries=64):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回 path 下已排序的子目录名列表，目录不可访问时抛出 OSError"""
+        mtime = os.stat(path).st_mtime_ns
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached and cached[0] == mtime and now - cached[1] < self._ttl:
+                self._entries.move_to_end(path)
+                return cached[2]
+        names = scan_directories(path)
+        with self._lock:
+            self._entries[path] = (mtime, now, names)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return names
+
+def paginate(names, cursor=None, limit=200, prefix=None):
+    """从已排序的名称列表中取出一页
+
+    prefix 按前缀过滤（不区分大小写），cursor 为上一页最后一个名称，
+    返回 (本页名称, 下一页的 cursor 或 None, 过滤后的总数)
+    """
+    if prefix:
+        prefix = prefix.lower()
+        names = [name for name in names if name.lower().startswith(prefix)]
+    start = bisect.bisect_right(names, cursor) if cursor else 0
+    page = names[start:start + limit]
+    next_cursor = page[-1] if page and start + limit < len(names) else None
+    return page, next_cursor, len(names)
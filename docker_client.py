@@ -0,0 +1,109 @@
+import time
+import threading
+import logging
+import docker
+import requests
+
+# 由 compose_manager 和 image_manager 共用，不属于任何一个蓝图的记录器
+logger = logging.getLogger(__name__)
+
+# 健康检查 ping 的超时（秒），不使用 docker_timeout，避免守护进程无响应时长时间等待
+HEALTH_CHECK_TIMEOUT = 5
+
+def is_connection_error(error):
+    """是否为与守护进程的连接失败（而不是请求超时或 API 错误），只有这类错误需要重新连接"""
+    return isinstance(error, requests.exceptions.ConnectionError) or (
+        isinstance(error, docker.errors.DockerException) and not isinstance(error, docker.errors.APIError))
+
+class SharedDockerClient:
+    """进程内共享的 Docker 客户端
+
+    docker.from_env() 每次都要探测 API 版本并建立新的连接，这里只在首次使用时创建一次，
+    之后所有请求复用同一个连接池（max_pool_size 个连接，可在多个线程中同时使用）。
+    距上次检查超过 health_interval 秒时先 ping 一次，连接失败（如守护进程重启）则换用新的客户端。
+    旧客户端可能仍被其他线程使用（如正在进行的导出和拉取），换用时不关闭，由垃圾回收释放。
+    调用方不能关闭取得的客户端；Docker 事件流等需要单独关闭连接的场景仍应使用独立的客户端
+    """
+
+    def __init__(self, pool_size=16, timeout=120, health_interval=30):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._health_interval = health_interval
+        self._lock = threading.Lock()
+        self._client = None
+        self._checked = 0
+
+    def configure(self, pool_size=None, timeout=None, health_interval=None):
+        """修改连接参数，下次取得客户端时按新参数重新连接"""
+        with self._lock:
+            if pool_size is not None:
+                self._pool_size = pool_size
+            if timeout is not None:
+                self._timeout = timeout
+            if health_interval is not None:
+                self._health_interval = health_interval
+            self._client = None
+
+    def get(self):
+        """返回可用的共享客户端，Docker 不可用时抛出 docker.errors.DockerException
+
+        健康检查和建立连接都在锁外进行，守护进程无响应时只阻塞执行检查的那个线程，
+        其他线程在此期间继续使用当前客户端
+        """
+        with self._lock:
+            client = self._client
+            now = time.monotonic()
+            check = client is not None and now - self._checked >= self._health_interval
+            if check:
+                self._checked = now
+        if check and not self._healthy(client):
+            with self._lock:
+                # 其他线程可能已经换用了新的客户端
+                if self._client is client:
+                    self._client = None
+            client = None
+        return client or self._connect()
+
+    def _healthy(self, client):
+        """用较短的超时 ping 一次，只有连接错误才认为需要重新连接"""
+        api = client.api
+        try:
+            api._result(api._get(api._url('/_ping'), timeout=HEALTH_CHECK_TIMEOUT))
+            return True
+        except Exception as e:
+            if is_connection_error(e):
+                logger.error(f"Docker health check failed, reconnecting: {e}")
+                return False
+            # 守护进程繁忙导致 ping 超时等情况，继续使用当前客户端
+            logger.error(f"Docker health check failed: {e}")
+            return True
+
+    def _connect(self):
+        with self._lock:
+            if self._client is not None:
+                return self._client
+            pool_size, timeout = self._pool_size, self._timeout
+        client = docker.from_env(max_pool_size=pool_size, timeout=timeout)
+        with self._lock:
+            if self._client is not None:
+                # 其他线程先连接成功，使用它的客户端，丢弃这个还没有被使用过的
+                client.close()
+                return self._client
+            self._client = client
+            self._checked = time.monotonic()
+        logger.info(f"Connected to Docker API {client.api.api_version} "
+                    f"(pool size {pool_size}, timeout {timeout}s)")
+        return client
+
+    def reset(self, error=None):
+        """调用方遇到连接错误时让下次使用重新连接；给出 error 时只在它是连接错误时才重新连接
+
+        不关闭当前客户端，其他线程上进行中的请求不受影响
+        """
+        if error is not None and not is_connection_error(error):
+            return
+        with self._lock:
+            self._client = None
+
+# 全局共享客户端，连接参数由 compose_manager 按配置设置
+shared_client = SharedDockerClient()
@@ -0,0 +1,193 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import docker
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.images')
+
+# 镜像处理结果
+FREED = 'freed'
+KEPT = 'kept'
+FAILED = 'failed'
+MISSING = 'missing'
+
+def normalize_image_ref(ref):
+    """把镜像引用规范为 Docker RepoTags 中的形式，如 nginx -> nginx:latest"""
+    ref = ref.strip()
+    for prefix in ('docker.io/library/', 'docker.io/', 'index.docker.io/library/', 'index.docker.io/'):
+        if ref.startswith(prefix):
+            ref = ref[len(prefix):]
+            break
+    if ref.startswith('library/'):
+        ref = ref[len('library/'):]
+    if '@' not in ref and ':' not in ref.rsplit('/', 1)[-1]:
+        ref += ':latest'
+    return ref
+
+def build_reference_map(project_refs):
+    """把 {项目: 镜像引用集合} 转换为 {规范化引用: 使用它的项目集合}"""
+    references = {}
+    for project, refs in project_refs.items():
+        for ref in refs:
+            references.setdefault(normalize_image_ref(ref), set()).add(project)
+    return references
+
+class ImageRemovalPlanner:
+    """按引用关系批量清理目标项目的镜像
+
+    只删除仅被目标项目引用的镜像：仍被其他项目的 compose 文件引用、被任一现存容器使用，
+    或还有其他标签的镜像都会保留。镜像查询和删除通过 Docker API 在有界线程池中并发执行，
+    每个镜像的结果为 freed / kept / failed / missing 之一，并统计回收的字节数。
+    """
+
+    def __init__(self, client, max_workers=4):
+        self._client = client
+        self._max_workers = max_workers
+
+    def plan(self, targets, project_refs):
+        """计算目标项目的镜像处理计划
+
+        targets 为要清理的项目集合，project_refs 为所有项目（包括目标项目）的
+        {项目: 镜像引用集合}。返回按镜像 ID 分组的计划列表
+        """
+        references = build_reference_map(project_refs)
+        target_refs = sorted({
+            normalize_image_ref(ref) for project in targets for ref in project_refs.get(project, ())
+        })
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='image-plan') as executor:
+            inspected = list(executor.map(self._inspect, target_refs))
+        # 目标项目的容器已经停止并删除，剩下的容器都视为镜像的使用者
+        containers = self._client.api.containers(all=True)
+        users = {}
+        for container in containers:
+            names = container.get('Names') or []
+            users.setdefault(container.get('ImageID'), []).append(
+                names[0].lstrip('/') if names else container['Id'][:12])
+
+        groups = {}
+        plan = []
+        for ref, (image, error) in zip(target_refs, inspected):
+            if error is not None:
+                # 查询失败不等于镜像不存在，作为失败报告给用户
+                plan.append({'id': None, 'refs': [ref], 'status': FAILED,
+                             'reason': str(error) or type(error).__name__, 'bytes': 0})
+                continue
+            if image is None:
+                plan.append({'id': None, 'refs': [ref], 'status': MISSING,
+                             'reason': '镜像不存在', 'bytes': 0})
+                continue
+            group = groups.get(image['Id'])
+            if group is None:
+                group = groups[image['Id']] = {
+                    'id': image['Id'],
+                    'refs': [],
+                    'tags': image.get('RepoTags') or [],
+                    'size': image.get('Size', 0),
+                    'status': None,
+                    'reason': '',
+                    'bytes': 0
+                }
+                plan.append(group)
+            group['refs'].append(ref)
+
+        for group in groups.values():
+            shared = sorted({
+                project for tag in group['tags'] + group['refs']
+                for project in references.get(normalize_image_ref(tag), ())
+                if project not in targets
+            })
+            if shared:
+                group['status'] = KEPT
+                group['reason'] = f"被其他项目使用: {', '.join(shared)}"
+            elif group['id'] in users:
+                group['status'] = KEPT
+                group['reason'] = f"被容器使用: {', '.join(users[group['id']])}"
+        return plan
+
+    def execute(self, plan, log=None, cancel=None):
+        """执行计划中待删除的镜像，返回汇总报告"""
+        log = log or (lambda line: None)
+        pending = [group for group in plan if group['status'] is None]
+        if pending:
+            with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='image-remove') as executor:
+                list(executor.map(lambda group: self._remove(group, cancel), pending))
+
+        report = {'items': [], FREED: 0, KEPT: 0, FAILED: 0, MISSING: 0, 'bytes_reclaimed': 0}
+        for group in plan:
+            item = {
+                'image': ', '.join(group['refs']),
+                'id': group['id'],
+                'status': group['status'],
+                'reason': group['reason'],
+                'bytes': group['bytes']
+            }
+            report['items'].append(item)
+            report[group['status']] += 1
+            report['bytes_reclaimed'] += group['bytes']
+            log(self.describe(item))
+        log(f"镜像清理完成: 释放 {report[FREED]} 个, 保留 {report[KEPT]} 个, "
+            f"失败 {report[FAILED]} 个, 回收 {format_bytes(report['bytes_reclaimed'])}")
+        return report
+
+    def run(self, targets, project_refs, log=None, cancel=None):
+        """计算计划并执行"""
+        return self.execute(self.plan(targets, project_refs), log, cancel)
+
+    @staticmethod
+    def describe(item):
+        if item['status'] == FREED:
+            return f"已删除镜像 {item['image']}，回收 {format_bytes(item['bytes'])}"
+        if item['status'] == KEPT:
+            return f"保留镜像 {item['image']}（{item['reason']}）"
+        if item['status'] == MISSING:
+            return f"镜像 {item['image']} 不存在，跳过"
+        return f"删除镜像 {item['image']} 失败: {item['reason']}"
+
+    def _inspect(self, ref):
+        """返回 (镜像信息, 错误)，镜像不存在时两者都为 None"""
+        try:
+            return self._client.api.inspect_image(ref), None
+        except docker.errors.ImageNotFound:
+            return None, None
+        except Exception as e:
+            # 守护进程繁忙、超时、连接中断等
+            logger.error(f"Error inspecting image {ref}: {e}")
+            return None, e
+
+    def _remove(self, group, cancel):
+        """逐个删除该镜像的目标标签，最后一个标签删除后镜像才会被真正删除"""
+        deleted = False
+        try:
+            for ref in group['refs']:
+                if cancel and cancel.is_set():
+                    group['status'] = FAILED
+                    group['reason'] = '任务已取消'
+                    return
+                for change in self._client.api.remove_image(ref):
+                    if change.get('Deleted') == group['id']:
+                        deleted = True
+        except docker.errors.APIError as e:
+            group['status'] = FAILED
+            group['reason'] = e.explanation or str(e)
+            return
+        except Exception as e:
+            # 连接中断、超时等非 API 错误同样只记为该镜像失败，不影响其他镜像的结果
+            logger.error(f"Error removing image {group['id'][:19]}: {e}")
+            group['status'] = FAILED
+            group['reason'] = str(e) or type(e).__name__
+            return
+        if deleted:
+            group['status'] = FREED
+            group['bytes'] = group['size']
+        else:
+            remaining = [tag for tag in group['tags'] if normalize_image_ref(tag) not in group['refs']]
+            group['status'] = KEPT
+            group['reason'] = f"已移除标签，镜像仍有其他标签: {', '.join(remaining) or group['id'][:19]}"
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
@@ -0,0 +1,139 @@
+import os
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# zstandard 为可选依赖，未安装时不提供 tar.zst 格式
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 导出格式 -> (文件扩展名, MIME 类型)
+EXPORT_FORMATS = {
+    'tar': ('.tar', 'application/x-tar'),
+    'tar.gz': ('.tar.gz', 'application/gzip'),
+    'tar.zst': ('.tar.zst', 'application/zstd')
+}
+
+# 各压缩格式的 (最低, 默认, 最高) 压缩级别
+COMPRESSION_LEVELS = {
+    'tar.gz': (1, 6, 9),
+    'tar.zst': (1, 3, 19)
+}
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# gzip 分块并行压缩时每块的大小，以及 deflate 可回溯的窗口大小
+GZIP_BLOCK_SIZE = 1024 * 1024
+DEFLATE_WINDOW = 32 * 1024
+
+def available_formats():
+    """返回当前环境可用的导出格式"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'tar.zst' or zstandard is not None]
+
+def default_workers():
+    """压缩线程数默认使用除一个核之外的全部 CPU，留一个核给请求处理"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def resolve_level(fmt, level):
+    """校验压缩级别，未指定时返回格式的默认级别，超出范围时抛出 ValueError"""
+    low, default, high = COMPRESSION_LEVELS[fmt]
+    if level in (None, ''):
+        return default
+    level = int(level)
+    if not low <= level <= high:
+        raise ValueError(f'{fmt} 的压缩级别应在 {low} 到 {high} 之间')
+    return level
+
+def _rechunk(chunks, size):
+    """把任意大小的数据块重新切成 size 字节的块（最后一块可能更小）"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+def _deflate_block(block, dictionary, level):
+    # 以前一块的末尾 32 KB 作为预置字典，压缩率与单线程压缩接近；
+    # 同步刷新使每块结束于字节边界，各块的输出可以直接拼接
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+def gzip_stream(chunks, level=6, workers=None, block_size=GZIP_BLOCK_SIZE):
+    """与 pigz 相同的方式并行生成 gzip 流
+
+    输入按 block_size 分块后由多个线程分别 deflate（zlib 压缩时释放 GIL），再按顺序输出；
+    同时在途的块数不超过线程数的两倍，内存占用与数据总量无关。输出是标准的单成员 gzip 文件
+    """
+    workers = workers or default_workers()
+    # 固定头部：无文件名，修改时间为 0，OS 为 unknown
+    yield b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+    crc = 0
+    size = 0
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gzip')
+    try:
+        dictionary = b''
+        for block in _rechunk(chunks, block_size):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(executor.submit(_deflate_block, block, dictionary, level))
+            dictionary = block[-DEFLATE_WINDOW:]
+            while len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+        # 空的最后一个块结束 deflate 流，然后是 CRC32 和原始长度（模 2^32）
+        yield b'\x03\x00' + struct.pack('<II', crc & 0xffffffff, size & 0xffffffff)
+    finally:
+        # 导出被取消时丢弃尚未开始的压缩任务
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def zstd_stream(chunks, level=3, workers=None):
+    """生成 zstd 流，由 libzstd 的多线程模式并行压缩"""
+    if zstandard is None:
+        raise RuntimeError('未安装 zstandard，无法导出 tar.zst')
+    compressor = zstandard.ZstdCompressor(level=level, threads=workers or default_workers())
+    stream = compressor.compressobj()
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+def compress_stream(chunks, fmt, level=None, workers=None):
+    """按导出格式压缩数据块流，tar 格式原样返回"""
+    if fmt == 'tar':
+        return chunks
+    level = resolve_level(fmt, level)
+    if fmt == 'tar.gz':
+        return gzip_stream(chunks, level, workers)
+    if fmt == 'tar.zst':
+        return zstd_stream(chunks, level, workers)
+    raise ValueError(f'不支持的导出格式: {fmt}')
+
+def read_image_archive(path, chunk_size=1024 * 1024):
+    """按块读取上传的镜像归档，用于 docker load
+
+    Docker 可以直接加载 tar 和 tar.gz；tar.zst 在这里边读边解压，不写出解压后的临时文件
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC
+        f.seek(0)
+        if compressed:
+            if zstandard is None:
+                raise RuntimeError('未安装 zstandard，无法加载 tar.zst 文件')
+            f = zstandard.ZstdDecompressor().stream_reader(f)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,370 @@
+import io
+import os
+import re
+import json
+import time
+import hashlib
+import tarfile
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger('image_manager.delta')
+
+# 增量导出时写入归档的清单，记录全部镜像层和被省略的镜像层
+DELTA_MANIFEST = 'wanzi-manifest.json'
+DOCKER_MANIFEST = 'manifest.json'
+
+# 镜像层摘要：sha256:<hex>，也匹配 OCI 布局中的 blobs/sha256/<hex> 路径
+DIGEST_PATTERN = re.compile(r'sha256[:/]([0-9a-f]{64})')
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+RECORD_SIZE = tarfile.RECORDSIZE
+COPY_SIZE = 1024 * 1024
+# 大小与已有镜像层相同、需要先计算摘要再决定是否省略的镜像层，超过该大小时暂存到磁盘
+SPOOL_SIZE = 64 * 1024 * 1024
+# 导入时在内存中保留的元数据文件（manifest.json 和镜像配置）的大小上限
+METADATA_SIZE = 4 * 1024 * 1024
+
+def parse_known_layers(content):
+    """解析对方已有的镜像层，返回 {摘要: 大小或 None}
+
+    content 可以是之前增量/完整导出归档中的 wanzi-manifest.json、对方镜像页面下载的层清单，
+    或任何包含 sha256:<hex> 摘要的文本（如 docker inspect 输出的 RootFS.Layers）
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get('layers'), dict):
+        return {
+            digest: size if isinstance(size, int) else None
+            for digest, size in data['layers'].items() if DIGEST_PATTERN.fullmatch(digest)
+        }
+    return {f'sha256:{hex_digest}': None for hex_digest in DIGEST_PATTERN.findall(content or '')}
+
+class _ChunkReader(io.RawIOBase):
+    """把数据块迭代器包装为只读的文件对象，供 tarfile 以流模式读取"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+def _open_stream(chunks):
+    return tarfile.open(fileobj=io.BufferedReader(_ChunkReader(chunks), COPY_SIZE), mode='r|*')
+
+def _header(member):
+    return member.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+def _padding(size):
+    return b'\0' * (-size % BLOCK_SIZE)
+
+def _copy(source, size, digest=None, sink=None):
+    """逐块读出成员内容，同时计算摘要或写入 sink"""
+    remaining = size
+    while remaining > 0:
+        data = source.read(min(COPY_SIZE, remaining))
+        if not data:
+            raise tarfile.ReadError('镜像归档被截断')
+        remaining -= len(data)
+        if digest is not None:
+            digest.update(data)
+        if sink is not None:
+            sink.write(data)
+        yield data
+
+def _layer_blob(member):
+    """OCI 布局（Docker 25 起的 docker save）中的 blob，返回其摘要"""
+    match = re.fullmatch(r'blobs/sha256/([0-9a-f]{64})', member.name)
+    return f'sha256:{match.group(1)}' if match and member.isfile() else None
+
+def _legacy_layer(member):
+    """旧格式 docker save 中的 <id>/layer.tar，摘要需按内容计算"""
+    return member.isfile() and os.path.basename(member.name) == 'layer.tar'
+
+def delta_stream(chunks, image_layers, known, summary=None):
+    """从 docker save 的 tar 流中去掉对方已有的镜像层，生成增量归档的 tar 流
+
+    image_layers 为导出镜像的全部层摘要（RootFS.Layers），只有其中的层可以被省略，配置和清单始终保留；
+    known 为 parse_known_layers 的结果。OCI 布局按 blob 文件名判断；旧格式的 layer.tar 需要计算摘要：
+    已知大小且大小不同的层直接转发，可能相同的层先暂存计算摘要再决定。
+    归档末尾写入 wanzi-manifest.json，summary（dict）中填入层数和省略的字节数
+    """
+    skippable = {digest: known[digest] for digest in image_layers if digest in known}
+    known_sizes = {size for size in skippable.values() if size is not None}
+    # 对方的清单没有大小时，每个旧格式的层都要先计算摘要
+    sizes_complete = all(size is not None for size in skippable.values())
+    layers = {}
+    omitted = {}
+    written = 0
+
+    def emit(data):
+        nonlocal written
+        written += len(data)
+        return data
+
+    with _open_stream(chunks) as tar:
+        for member in tar:
+            source = tar.extractfile(member) if member.isfile() else None
+            digest = _layer_blob(member)
+            if digest and digest in image_layers:
+                layers[digest] = member.size
+                if digest in skippable:
+                    omitted[digest] = member.size
+                    for _ in _copy(source, member.size):
+                        pass
+                    continue
+            elif _legacy_layer(member):
+                if skippable and (member.size in known_sizes or not sizes_complete):
+                    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+                        hasher = hashlib.sha256()
+                        for _ in _copy(source, member.size, hasher, spool):
+                            pass
+                        digest = f'sha256:{hasher.hexdigest()}'
+                        layers[digest] = member.size
+                        if digest in skippable:
+                            omitted[digest] = member.size
+                            continue
+                        spool.seek(0)
+                        yield emit(_header(member))
+                        for data in _copy(spool, member.size):
+                            yield emit(data)
+                        yield emit(_padding(member.size))
+                    continue
+                # 不可能被省略的层边转发边计算摘要，只为写入清单
+                hasher = hashlib.sha256()
+                yield emit(_header(member))
+                for data in _copy(source, member.size, hasher):
+                    yield emit(data)
+                yield emit(_padding(member.size))
+                layers[f'sha256:{hasher.hexdigest()}'] = member.size
+                continue
+
+            yield emit(_header(member))
+            if source is not None:
+                for data in _copy(source, member.size):
+                    yield emit(data)
+                yield emit(_padding(member.size))
+
+    manifest = json.dumps({
+        'version': 1,
+        'created': time.time(),
+        'layers': layers,
+        'omitted': sorted(omitted)
+    }, indent=2).encode('utf-8')
+    info = tarfile.TarInfo(DELTA_MANIFEST)
+    info.size = len(manifest)
+    info.mtime = int(time.time())
+    yield emit(_header(info) + manifest + _padding(len(manifest)))
+    # 两个空块结束归档，并按 tar 的记录大小补齐
+    end = b'\0' * (BLOCK_SIZE * 2)
+    yield end + b'\0' * (-(written + len(end)) % RECORD_SIZE)
+    if summary is not None:
+        summary.update(
+            layers=len(layers),
+            omitted=len(omitted),
+            omitted_size=sum(omitted.values())
+        )
+    logger.info(f"Delta export omitted {len(omitted)} of {len(layers)} layers "
+                f"({sum(omitted.values())} bytes)")
+
+class LayerStore:
+    """按摘要保存导入过的镜像层，用于补全增量归档中省略的层
+
+    每个层保存为 <root>/sha256/<hex>.tar，总大小超过 max_size 时按最近使用时间淘汰
+    """
+
+    def __init__(self, root, max_size=20 * 1024 ** 3):
+        self.root = root
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def configure(self, root=None, max_size=None):
+        """修改保存目录和大小上限，已保存在原目录中的层不会迁移"""
+        with self._lock:
+            if root is not None:
+                self.root = root
+            if max_size is not None:
+                self._max_size = max_size
+
+    def path(self, digest):
+        return os.path.join(self.root, 'sha256', digest.split(':', 1)[-1] + '.tar')
+
+    def has(self, digest):
+        return bool(DIGEST_PATTERN.fullmatch(digest or '')) and os.path.isfile(self.path(digest))
+
+    def layers(self):
+        """返回已保存的层 {摘要: 大小}"""
+        try:
+            entries = list(os.scandir(os.path.join(self.root, 'sha256')))
+        except FileNotFoundError:
+            return {}
+        return {
+            'sha256:' + entry.name[:-len('.tar')]: entry.stat().st_size
+            for entry in entries if entry.is_file() and entry.name.endswith('.tar')
+        }
+
+    def open(self, digest):
+        """打开已保存的层并更新其使用时间，不存在时返回 None"""
+        # 摘要来自上传的镜像配置，格式不对时不能用于拼接路径
+        if not DIGEST_PATTERN.fullmatch(digest or ''):
+            return None
+        path = self.path(digest)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def writer(self):
+        """返回写入新层的临时文件，写完后调用 commit(f, digest) 或 discard(f)"""
+        directory = os.path.join(self.root, 'sha256')
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, prefix='.incoming-', delete=False)
+
+    def commit(self, f, digest):
+        f.close()
+        os.replace(f.name, self.path(digest))
+
+    def discard(self, f):
+        f.close()
+        try:
+            os.unlink(f.name)
+        except OSError:
+            pass
+
+    def prune(self):
+        """淘汰最久未使用的层，使总大小不超过 max_size"""
+        directory = os.path.join(self.root, 'sha256')
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(directory)
+                           if entry.is_file() and entry.name.endswith('.tar')]
+            except FileNotFoundError:
+                return
+            stats = sorted(((entry.stat(), entry.path) for entry in entries), key=lambda item: item[0].st_mtime)
+            total = sum(stat.st_size for stat, _ in stats)
+            for stat, path in stats:
+                if total <= self._max_size:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= stat.st_size
+                except OSError:
+                    pass
+
+# 全局镜像层存储，默认放在挂载到宿主机的日志目录下，容器重建后仍然保留；
+# 目录和大小上限由 compose_manager 按 config.yaml 配置
+layer_store = LayerStore(os.path.join('logs', 'layer_store'))
+
+def rebuild_stream(chunks, store, summary=None):
+    """把上传的归档（完整或增量）重建为可直接 docker load 的 tar 流
+
+    新收到的镜像层同时保存到 store；增量归档省略的层按 manifest.json 和镜像配置中的路径从 store 补回。
+    store 中也没有的层不补（本机 Docker 已有这些层时 docker load 不会读取它们），记入 summary['missing']
+    """
+    metadata = {}
+    emitted = set()
+    stored = restored = 0
+    with _open_stream(chunks) as tar:
+        for member in tar:
+            if member.name == DELTA_MANIFEST:
+                # 增量清单只用于导出端，不传给 docker load
+                for _ in _copy(tar.extractfile(member), member.size):
+                    pass
+                continue
+            emitted.add(member.name)
+            yield _header(member)
+            if not member.isfile():
+                continue
+            source = tar.extractfile(member)
+            digest = _layer_blob(member)
+            legacy = _legacy_layer(member)
+            # OCI 布局中镜像配置也是 blob，小文件留在内存中用于查找层路径，
+            # 读完清单确定是镜像层后再保存，避免把配置和清单存入层存储
+            buffer = io.BytesIO() if not legacy and member.size <= METADATA_SIZE else None
+            sink = hasher = None
+            if (legacy or (digest and buffer is None)) and not store.has(digest):
+                sink, hasher = store.writer(), hashlib.sha256()
+            try:
+                for data in _copy(source, member.size, hasher, sink):
+                    if buffer is not None:
+                        buffer.write(data)
+                    yield data
+            except BaseException:
+                if sink:
+                    store.discard(sink)
+                raise
+            if buffer is not None:
+                metadata[member.name] = buffer.getvalue()
+            if sink:
+                actual = f'sha256:{hasher.hexdigest()}'
+                # OCI blob 名与内容不符或层已保存时丢弃
+                if (digest and digest != actual) or store.has(actual):
+                    store.discard(sink)
+                else:
+                    store.commit(sink, actual)
+                    stored += 1
+            yield _padding(member.size)
+
+    # 根据 manifest.json 和镜像配置找出每个层在归档中的路径
+    missing = []
+    written = set()
+    try:
+        manifests = json.loads(metadata.get(DOCKER_MANIFEST, b'[]'))
+    except ValueError:
+        manifests = []
+    for entry in manifests:
+        try:
+            config = json.loads(metadata[entry['Config']])
+            diff_ids = config['rootfs']['diff_ids']
+        except (KeyError, ValueError, TypeError):
+            continue
+        for path, digest in zip(entry.get('Layers') or [], diff_ids):
+            if path in metadata and not store.has(digest):
+                # 较小的 OCI 镜像层
+                sink = store.writer()
+                sink.write(metadata[path])
+                if hashlib.sha256(metadata[path]).hexdigest() == digest.split(':', 1)[-1]:
+                    store.commit(sink, digest)
+                    stored += 1
+                else:
+                    store.discard(sink)
+            if path in emitted or path in written:
+                continue
+            layer = store.open(digest)
+            if layer is None:
+                missing.append(digest)
+                continue
+            with layer:
+                info = tarfile.TarInfo(path)
+                info.size = os.fstat(layer.fileno()).st_size
+                info.mtime = int(time.time())
+                yield _header(info)
+                for data in _copy(layer, info.size):
+                    yield data
+                yield _padding(info.size)
+            written.add(path)
+            restored += 1
+    yield b'\0' * (BLOCK_SIZE * 2)
+    store.prune()
+    if summary is not None:
+        summary.update(stored=stored, restored=restored, missing=sorted(set(missing)))
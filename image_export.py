@@ -0,0 +1,112 @@
+import re
+import time
+import uuid
+import threading
+
+# 导出 ID 只允许十六进制字符，由浏览器生成或服务器分配
+EXPORT_ID_PATTERN = re.compile(r'^[0-9a-f]{8,64}$')
+
+class ExportTracker:
+    """记录每次镜像导出的进度
+
+    每次导出有独立的 ID，进度按实际转发的字节数累计，总大小按镜像大小之和估算（tar 会略大一些）。
+    订阅方通过 wait() 阻塞到进度变化或导出结束，不需要定时轮询；
+    结束的导出保留 retention 秒供迟到的订阅方读取最终状态
+    """
+
+    def __init__(self, retention=600, update_step=1024 * 1024):
+        self._retention = retention
+        # 进度至少增加 update_step 字节才唤醒订阅方，避免每个数据块都通知
+        self._update_step = update_step
+        self._condition = threading.Condition()
+        self._exports = {}
+
+    def create(self, images, total_size, export_id=None):
+        """登记一次导出并返回导出 ID，export_id 无效或已被使用时分配新的 ID"""
+        with self._condition:
+            self._prune()
+            if not export_id or not EXPORT_ID_PATTERN.match(export_id) or export_id in self._exports:
+                export_id = uuid.uuid4().hex
+            self._exports[export_id] = {
+                'id': export_id,
+                'images': images,
+                'status': 'running',
+                'total_size': total_size,
+                'exported_size': 0,
+                'sent_size': 0,
+                'percent': 0,
+                'message': None,
+                'started': time.time(),
+                'finished': None,
+                'version': 0,
+                '_notified_size': 0
+            }
+            self._condition.notify_all()
+            return export_id
+
+    def advance(self, export_id, size):
+        """累加已转发的字节数"""
+        with self._condition:
+            export = self._exports.get(export_id)
+            if not export:
+                return
+            export['exported_size'] += size
+            if export['exported_size'] - export['_notified_size'] < self._update_step:
+                return
+            export['_notified_size'] = export['exported_size']
+            total = export['total_size']
+            # 未完成前最多显示 99%
+            export['percent'] = min(99, export['exported_size'] * 100 // total) if total else 0
+            export['version'] += 1
+            self._condition.notify_all()
+
+    def sent(self, export_id, size):
+        """累加实际发送给浏览器的字节数（压缩导出时小于 exported_size），不单独通知订阅方"""
+        with self._condition:
+            export = self._exports.get(export_id)
+            if export:
+                export['sent_size'] += size
+
+    def finish(self, export_id, status, message=None):
+        """结束导出，status 为 completed / cancelled / failed"""
+        with self._condition:
+            export = self._exports.get(export_id)
+            if not export or export['status'] != 'running':
+                return
+            export['status'] = status
+            export['message'] = message
+            export['finished'] = time.time()
+            if status == 'completed':
+                export['percent'] = 100
+            export['version'] += 1
+            self._condition.notify_all()
+
+    def get(self, export_id):
+        with self._condition:
+            export = self._exports.get(export_id)
+            return self._public(export) if export else None
+
+    def wait(self, export_id, version=-1, timeout=15):
+        """等待导出的版本超过 version 并返回其状态
+
+        导出尚未登记（浏览器先于下载请求订阅）时同样等待；超时返回 None
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                export = self._exports.get(export_id)
+                if export and export['version'] > version:
+                    return self._public(export)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _public(self, export):
+        return {key: value for key, value in export.items() if not key.startswith('_')}
+
+    def _prune(self):
+        cutoff = time.time() - self._retention
+        for export_id, export in list(self._exports.items()):
+            if export['finished'] and export['finished'] < cutoff:
+                del self._exports[export_id]
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, Response, session
+from flask import Blueprint, render_template, request, jsonify, Response, session
 import requests
 from datetime import datetime, timezone
 import socket
@@ -11,8 +11,12 @@ import os
 import tempfile
 import subprocess
 import json
-import threading
 from languages import load_language, SUPPORTED_LANGUAGES
+from image_refs import image_reference_index
+from docker_client import shared_client
+from image_export import ExportTracker
+from image_delta import layer_store, delta_stream, parse_known_layers, rebuild_stream
+from image_compress import EXPORT_FORMATS, COMPRESSION_LEVELS, available_formats, compress_stream, resolve_level, read_image_archive
 
 # 版本号常量
 __version__ = '1.2.0'
@@ -26,13 +30,12 @@ DOCKER_SERVICE_URL = 'http://localhost:5526'
 # 创建日志记录器
 logger = logging.getLogger(__name__)
 
-# 添加全局变量来存储导出进度
-export_progress = {
-    'percent': 0,
-    'exported_size': 0,
-    'current_image': None
-}
-export_lock = threading.Lock()
+# 每次镜像导出的进度
+export_tracker = ExportTracker()
+# 导出镜像时每次转发给浏览器的数据块大小
+EXPORT_CHUNK_SIZE = 1024 * 1024
+# 订阅进度时等待导出开始的最长时间（秒）
+EXPORT_WAIT_TIMEOUT = 30
 
 # 配置文件路径
 REGISTRY_CONFIG_FILE = 'registry_config.json'
@@ -58,12 +61,18 @@ def image_list():
     lang = load_language(current_lang)
     
     images = get_docker_images()
+    # 从引用索引中查找每个镜像被哪些项目和容器使用
+    image_reference_index.refresh()
+    for image in images:
+        image.update(image_reference_index.lookup(image.get('id'), image.get('tags') or []))
     return render_template('docker_images.html', 
                          images=images,
                          version=__version__,
                          lang=lang,
                          current_lang=current_lang,
-                         supported_languages=SUPPORTED_LANGUAGES)
+                         supported_languages=SUPPORTED_LANGUAGES,
+                         export_formats=available_formats(),
+                         compression_levels=COMPRESSION_LEVELS)
 
 @image_bp.route('/images/delete', methods=['POST'])
 def delete_docker_images():
@@ -77,7 +86,7 @@ def delete_docker_images():
         })
     
     try:
-        client = docker.from_env()
+        client = shared_client.get()
         deleted = []
         errors = []
         deleted_size = 0
@@ -149,7 +158,7 @@ def push_docker_images():
                 'message': '缺少必要参数'
             })
             
-        client = docker.from_env()
+        client = shared_client.get()
         
         # 设置代理（如果有）
         proxy_type = data.get('proxy_type')
@@ -409,7 +418,7 @@ def upload_docker_image():
     tag = request.form.get('tag', 'latest')
     
     try:
-        client = docker.from_env()
+        client = shared_client.get()
         temp_file = None
         
         if upload_type == 'file':
@@ -425,10 +434,10 @@ def upload_docker_image():
             file.save(temp_file.name)
             file_path = temp_file.name
             
+            summary = {}
             try:
-                # 加载镜像
-                with open(file_path, 'rb') as f:
-                    images = client.images.load(f)
+                # 加载镜像（tar、tar.gz 或 tar.zst），增量归档省略的层从本地层存储补回
+                images = client.images.load(rebuild_stream(read_image_archive(file_path), layer_store, summary))
                 
                 # 获取加载的镜像信息
                 loaded_images = []
@@ -445,13 +454,24 @@ def upload_docker_image():
                     if image_name:
                         image.tag(image_name, tag)
                 
+                message = f'成功加载 {len(loaded_images)} 个镜像'
+                if summary.get('restored'):
+                    message += f"，从本地层存储补回 {summary['restored']} 个镜像层"
                 return jsonify({
                     'status': 'success',
-                    'message': f'成功加载 {len(loaded_images)} 个镜像',
+                    'message': message,
                     'images': loaded_images
                 })
                 
             except Exception as e:
+                if summary.get('missing'):
+                    # 增量归档缺少的层既不在层存储中，本机 Docker 也没有
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'镜像加载失败: 缺少 {len(summary["missing"])} 个镜像层，'
+                                   f'请先导入包含这些层的完整镜像: {str(e)}',
+                        'missing_layers': summary['missing']
+                    })
                 # 如果加载失败，尝试使用 docker load 命令
                 try:
                     result = subprocess.run(['docker', 'load', '-i', file_path], 
@@ -495,10 +515,9 @@ def upload_docker_image():
                         f.write(chunk)
             
             # 加载镜像并添加自定义标签
-            with open(temp_file.name, 'rb') as f:
-                images = client.images.load(f)
-                if image_name and images:
-                    images[0].tag(image_name, tag)
+            images = client.images.load(rebuild_stream(read_image_archive(temp_file.name), layer_store))
+            if image_name and images:
+                images[0].tag(image_name, tag)
             
             return jsonify({
                 'status': 'success',
@@ -532,9 +551,8 @@ def pull_docker_image():
                         temp_file.write(chunk)
                 
                 # 加载镜像
-                client = docker.from_env()
-                with open(temp_file.name, 'rb') as f:
-                    image = client.images.load(f)[0]
+                client = shared_client.get()
+                image = client.images.load(read_image_archive(temp_file.name))[0]
                 
                 # 清理临时文件
                 os.unlink(temp_file.name)
@@ -562,7 +580,7 @@ def pull_docker_image():
                 image_name = f"{registry_url}/{image_name}"
             
             # 拉取镜像
-            client = docker.from_env()
+            client = shared_client.get()
             image = client.images.pull(image_name, tag=tag)
             
             return jsonify({
@@ -592,44 +610,106 @@ def pull_docker_image():
             'message': str(e)
         }) 
 
-def update_export_progress(percent, exported_size, current_image):
-    global export_progress
-    with export_lock:
-        export_progress['percent'] = percent
-        export_progress['exported_size'] = exported_size
-        export_progress['current_image'] = current_image
+@image_bp.route('/export/<export_id>/progress')
+def export_progress(export_id):
+    """通过 Server-Sent Events 推送单次导出的进度
 
-@image_bp.route('/export/progress')
-def export_progress():
+    只在进度变化时发送，导出结束（completed / cancelled / failed）后发送最终状态并关闭连接；
+    导出在 EXPORT_WAIT_TIMEOUT 秒内没有开始时发送 status=unknown 并关闭
+    """
     def generate():
+        version = -1
+        waited = 0
         while True:
-            with export_lock:
-                # 发送当前进度
-                yield f"data: {json.dumps(export_progress)}\n\n"
-            time.sleep(0.5)  # 每500ms更新一次
+            export = export_tracker.wait(export_id, version, timeout=15)
+            if export is None:
+                if export_tracker.get(export_id) is None:
+                    waited += 15
+                    if waited >= EXPORT_WAIT_TIMEOUT:
+                        yield f"data: {json.dumps({'id': export_id, 'status': 'unknown'})}\n\n"
+                        return
+                # 保持连接
+                yield ": keepalive\n\n"
+                continue
+            version = export['version']
+            yield f"data: {json.dumps(export)}\n\n"
+            if export['status'] != 'running':
+                return
     
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@image_bp.route('/images/layers')
+def list_image_layers():
+    """下载本机已有的镜像层清单，作为对方增量导出的 known_layers
+
+    包括本机 Docker 中全部镜像的层和本地层存储中的层，层存储中的层附带大小
+    """
+    try:
+        client = shared_client.get()
+        layers = {}
+        for image in client.images.list(all=True):
+            for digest in (image.attrs.get('RootFS') or {}).get('Layers') or []:
+                layers[digest] = None
+        layers.update(layer_store.layers())
+        body = json.dumps({'version': 1, 'layers': layers}, indent=2)
+        return Response(body, mimetype='application/json', headers={
+            'Content-Disposition': f'attachment; filename="{socket.gethostname()}-layers.json"'
+        })
+    except Exception as e:
+        logger.error(f"Error listing image layers: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
 
 @image_bp.route('/export', methods=['POST'])
 def export_docker_images():
-    """导出选中的Docker镜像"""
+    """导出选中的Docker镜像
+
+    直接把 Docker API 的镜像保存流按固定大小的块转发给浏览器，不写临时文件，内存占用与镜像大小无关；
+    format 为 tar.gz / tar.zst 时在转发途中用多个线程压缩，level 为压缩级别。
+    delta 为真时生成增量归档：省略 known_layers（对方已有的层摘要或之前导出的清单）中的镜像层，
+    并在归档中附带 wanzi-manifest.json，作为下一次增量导出的依据。
+    浏览器断开连接时关闭到守护进程的连接，守护进程随即停止导出
+    """
     image_ids = request.form.getlist('image_ids')
+    export_format = request.form.get('format') or 'tar'
     
     if not image_ids:
         return jsonify({
             'status': 'error',
             'message': '没有选择镜像'
         })
+    if export_format not in available_formats():
+        return jsonify({
+            'status': 'error',
+            'message': f'不支持的导出格式: {export_format}'
+        })
     
     try:
-        client = docker.from_env()
-        # 获取选中镜像的标签信息
+        level = resolve_level(export_format, request.form.get('level')) if export_format != 'tar' else None
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+    
+    try:
+        client = shared_client.get()
+        # 获取选中镜像的标签信息，镜像大小之和用于估算导出进度
         image_tags = []
+        image_layers = set()
+        total_size = 0
         for image_id in image_ids:
             try:
                 image = client.images.get(image_id)
                 tags = image.tags[0] if image.tags else image_id[:12]
                 image_tags.append(tags.replace('/', '_').replace(':', '_'))
+                total_size += image.attrs.get('Size', 0)
+                image_layers.update((image.attrs.get('RootFS') or {}).get('Layers') or [])
             except Exception as e:
                 logger.error(f"Error getting image {image_id}: {e}")
                 return jsonify({
@@ -637,61 +717,66 @@ def export_docker_images():
                     'message': f'获取镜像信息失败: {str(e)}'
                 })
         
-        # 创建临时文件
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.tar')
-        temp_path = temp_file.name
-        temp_file.close()
-        
+        # 与 docker save 相同的 /images/get 接口，docker SDK 只提供单个镜像的版本
+        res = client.api._get(client.api._url('/images/get'), params={'names': image_ids}, stream=True)
         try:
-            # 使用 docker save 命令导出镜像
-            cmd = ['docker', 'save', '-o', temp_path] + image_ids
-            
-            # 执行导命令
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            # 验证导出的文件
-            if not os.path.exists(temp_path):
-                raise Exception("Export file was not created")
-                
-            file_size = os.path.getsize(temp_path)
-            if file_size == 0:
-                raise Exception("Export file is empty")
-            
-            # 使用标签作为文件名
-            filename = f"docker_images_{'_'.join(image_tags)}.tar"
-            
-            # 发文件
-            response = send_file(
-                temp_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/x-tar'
-            )
-            
-            # 添加清理回调
-            @response.call_on_close
-            def cleanup():
-                try:
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
-                except Exception as e:
-                    logger.error(f"Error cleaning up temp file: {e}")
-            
-            return response
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Docker save command failed: {e.stderr}")
-            return jsonify({
-                'status': 'error',
-                'message': f'导出失败: {e.stderr}'
-            })
-        except Exception as e:
-            logger.error(f"Error during export: {e}")
-            return jsonify({
-                'status': 'error',
-                'message': f'导出失败: {str(e)}'
-            })
+            # 开始传输前检查守护进程的错误，出错时仍可返回 JSON
+            client.api._raise_for_status(res)
+        except Exception:
+            res.close()
+            raise
+        chunks = client.api._stream_raw_result(res, EXPORT_CHUNK_SIZE, False)
+        export_id = export_tracker.create(image_tags, total_size, request.form.get('export_id'))
+        
+        def counted():
+            # 进度按压缩前的字节数计算，与按镜像大小估算的总量对应
+            for chunk in chunks:
+                export_tracker.advance(export_id, len(chunk))
+                yield chunk
+        
+        delta = request.form.get('delta') in ('1', 'true', 'on')
+        known = parse_known_layers(request.form.get('known_layers', '')) if delta else {}
+        
+        def generate():
+            status, message = 'cancelled', None
+            source = delta_stream(counted(), image_layers, known) if delta else counted()
+            output = compress_stream(source, export_format, level)
+            try:
+                for data in output:
+                    export_tracker.sent(export_id, len(data))
+                    yield data
+                status = 'completed'
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                # 守护进程在传输途中出错，浏览器只能收到不完整的文件
+                logger.error(f"Error streaming export {export_id}: {e}")
+                status, message = 'failed', str(e)
+                raise
+            finally:
+                # 浏览器断开时在这里关闭连接，守护进程写入失败后停止导出
+                if hasattr(output, 'close'):
+                    output.close()
+                res.close()
+                export_tracker.finish(export_id, status, message)
+                if status != 'completed':
+                    logger.info(f"Export {export_id} {status}")
         
+        # 使用标签作为文件名
+        extension, mimetype = EXPORT_FORMATS[export_format]
+        filename = f"docker_images_{'_'.join(image_tags)}{'_delta' if delta else ''}{extension}"
+        return Response(generate(), mimetype=mimetype, direct_passthrough=True, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no',
+            'X-Export-Id': export_id
+        })
+        
+    except docker.errors.APIError as e:
+        logger.error(f"Docker image export failed: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'导出失败: {e.explanation or e}'
+        })
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         return jsonify({
@@ -870,7 +955,7 @@ def tag_image():
                 'message': '缺少必要参数'
             })
         
-        client = docker.from_env()
+        client = shared_client.get()
         image = client.images.get(image_id)
         
         # 解析新标签
@@ -925,7 +1010,7 @@ def delete_tag():
                 'message': '缺少必要参数'
             })
         
-        client = docker.from_env()
+        client = shared_client.get()
         image = client.images.get(image_id)
         
         # 确保镜像至少有两个标签才允许删除
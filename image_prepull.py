@@ -0,0 +1,136 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+import docker
+from image_cleanup import normalize_image_ref
+from docker_client import shared_client
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.prepull')
+
+class PrePull:
+    """一次预拉取：所有镜像在线程池中并发拉取，每个项目可单独等待自己的镜像"""
+
+    def __init__(self, images_by_project, max_workers, on_event=None, cancel=None, progress_interval=0.5):
+        self._on_event = on_event or (lambda event: None)
+        self._cancel = cancel
+        self._progress_interval = progress_interval
+        self._started = time.monotonic()
+        self._finished = None
+        self._lock = threading.Lock()
+        self._client = shared_client.get()
+
+        # 去重：不同写法的同一镜像（如 nginx 和 docker.io/library/nginx:latest）只拉取一次
+        refs = {}
+        self._project_images = {}
+        for project, images in images_by_project.items():
+            keys = set()
+            for ref in images:
+                key = normalize_image_ref(ref)
+                refs.setdefault(key, ref)
+                keys.add(key)
+            self._project_images[project] = keys
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pull')
+        self._futures = {key: self._executor.submit(self._pull, ref) for key, ref in sorted(refs.items())}
+        self._executor.shutdown(wait=False)
+
+    def wait(self, project):
+        """等待项目的镜像全部拉取完成，返回 (等待秒数, 拉取失败的镜像列表)"""
+        started = time.monotonic()
+        futures = [self._futures[key] for key in self._project_images.get(project, ())]
+        wait(futures)
+        failed = [future.result()['image'] for future in futures if future.result()['status'] == 'failed']
+        return round(time.monotonic() - started, 3), failed
+
+    def summary(self):
+        """等待全部拉取结束并返回汇总
+
+        serial_duration 为各镜像拉取耗时之和，即逐个拉取时的耗时，
+        saved 为并发拉取相比逐个拉取节省的时间
+        """
+        wait(self._futures.values())
+        results = [future.result() for future in self._futures.values()]
+        with self._lock:
+            finished = self._finished or time.monotonic()
+        duration = finished - self._started
+        serial = sum(result['duration'] for result in results)
+        return {
+            'images': results,
+            'pulled': sum(1 for result in results if result['status'] == 'pulled'),
+            'present': sum(1 for result in results if result['status'] == 'present'),
+            'failed': sum(1 for result in results if result['status'] == 'failed'),
+            'duration': round(duration, 3),
+            'serial_duration': round(serial, 3),
+            'saved': round(max(0, serial - duration), 3)
+        }
+
+    def _pull(self, ref):
+        started = time.monotonic()
+        try:
+            try:
+                self._client.api.inspect_image(ref)
+                result = {'image': ref, 'status': 'present'}
+            except docker.errors.ImageNotFound:
+                self._on_event({'image': ref, 'layer': None, 'status': 'Pulling'})
+                self._stream_pull(ref)
+                result = {'image': ref, 'status': 'pulled'}
+        except Exception as e:
+            logger.error(f"Error pulling image {ref}: {e}")
+            result = {'image': ref, 'status': 'failed', 'error': str(e)}
+        result['duration'] = round(time.monotonic() - started, 3) if result['status'] != 'present' else 0
+        self._on_event({'image': ref, 'layer': None, 'status': result['status'], 'error': result.get('error')})
+        with self._lock:
+            self._finished = time.monotonic()
+        return result
+
+    def _stream_pull(self, ref):
+        """拉取镜像并按层上报进度，同一层的进度至多每 progress_interval 秒上报一次"""
+        last = {}
+        for event in self._client.api.pull(ref, stream=True, decode=True):
+            if self._cancel and self._cancel.is_set():
+                raise Exception('拉取已取消')
+            if event.get('error'):
+                raise Exception(event['error'])
+            layer = event.get('id')
+            status = event.get('status', '')
+            now = time.monotonic()
+            previous = last.get(layer)
+            if previous and previous[0] == status and now - previous[1] < self._progress_interval:
+                continue
+            last[layer] = (status, now)
+            detail = event.get('progressDetail') or {}
+            self._on_event({
+                'image': ref,
+                'layer': layer,
+                'status': status,
+                'current': detail.get('current'),
+                'total': detail.get('total')
+            })
+
+class ImagePrePuller:
+    """部署前的镜像预拉取
+
+    收集所有选中项目需要拉取的镜像并去重，在有界线程池中并发拉取，
+    各项目的 up 只需等待自己的镜像，无需等待全部镜像拉取完成
+    """
+
+    def __init__(self, max_workers=3):
+        self._max_workers = max_workers
+
+    def start(self, images_by_project, on_event=None, cancel=None):
+        """开始拉取 {项目: 镜像引用集合} 中的镜像，立即返回 PrePull"""
+        return PrePull(images_by_project, self._max_workers, on_event, cancel)
+
+def describe_pull_event(event):
+    """把拉取进度事件转换为一行日志"""
+    line = f"{event['image']}"
+    if event.get('layer'):
+        line += f" {event['layer']}"
+    line += f": {event['status']}"
+    if event.get('total'):
+        line += f" {event.get('current') or 0}/{event['total']}"
+    if event.get('error'):
+        line += f" ({event['error']})"
+    return line
@@ -0,0 +1,204 @@
+import os
+import re
+import time
+import threading
+import logging
+import yaml
+from compose_events import COMPOSE_PROJECT_LABEL
+from image_cleanup import normalize_image_ref
+from compose_yaml import parse_compose
+from docker_client import shared_client
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.image_refs')
+
+# compose 变量替换: $$、${VAR}、${VAR:-默认值}、${VAR-默认值}、${VAR:?错误}、${VAR:+替换值}、$VAR
+VARIABLE_PATTERN = re.compile(
+    r'\$(?:(?P<escaped>\$)|\{(?P<braced>[A-Za-z_][A-Za-z0-9_]*)(?:(?P<op>:?[-?+])(?P<arg>[^}]*))?\}'
+    r'|(?P<named>[A-Za-z_][A-Za-z0-9_]*))'
+)
+
+def parse_env(content):
+    """解析 .env 文件内容为字典"""
+    env = {}
+    for line in (content or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        if line.startswith('export '):
+            line = line[len('export '):]
+        key, value = line.split('=', 1)
+        value = value.strip()
+        if value[:1] in ('"', "'") and value.find(value[0], 1) > 0:
+            value = value[1:value.find(value[0], 1)]
+        elif ' #' in value:
+            value = value.split(' #', 1)[0].rstrip()
+        env[key.strip()] = value
+    return env
+
+def interpolate(value, env):
+    """按 compose 的规则替换字符串中的变量"""
+    def replace(match):
+        if match.group('escaped'):
+            return '$'
+        name = match.group('braced') or match.group('named')
+        op = match.group('op')
+        current = env.get(name)
+        if not op:
+            return current or ''
+        arg = match.group('arg')
+        unset = current is None or (op.startswith(':') and current == '')
+        if op.endswith('-'):
+            return arg if unset else current
+        if op.endswith('+'):
+            return '' if unset else arg
+        return current or ''
+    return VARIABLE_PATTERN.sub(replace, value)
+
+def service_images(project_name, compose_name, compose_content, env_content):
+    """逐个返回项目服务的 (服务名, 服务配置, 镜像引用)，镜像引用已替换变量
+
+    只有 build 没有 image 的服务使用 compose 构建时生成的镜像名 <项目名>-<服务名>
+    """
+    try:
+        compose_data = parse_compose(compose_content) or {}
+    except yaml.YAMLError:
+        return
+    if not isinstance(compose_data, dict):
+        return
+    # 与 docker compose 相同，进程环境变量优先于 .env
+    env = dict(parse_env(env_content), **os.environ)
+    # 递归发现的项目名为相对路径，compose 默认以最后一级目录名作为项目名
+    label = compose_name or re.sub(r'[^a-z0-9_-]', '', os.path.basename(project_name).lower()).lstrip('_-')
+    for service_name, service in (compose_data.get('services') or {}).items():
+        if not isinstance(service, dict):
+            continue
+        if service.get('image'):
+            ref = interpolate(str(service['image']), env).strip()
+            if ref:
+                yield service_name, service, ref
+        elif service.get('build'):
+            yield service_name, service, f'{label}-{service_name}'
+
+def project_image_refs(project_name, compose_name, compose_content, env_content):
+    """返回项目所有服务引用的镜像（已替换变量）"""
+    return {ref for _, _, ref in service_images(project_name, compose_name, compose_content, env_content)}
+
+def project_pull_refs(project_name, compose_name, compose_content, env_content):
+    """返回项目中需要从镜像仓库拉取的镜像，跳过需要本地构建或禁止拉取的服务"""
+    return {
+        ref for _, service, ref in service_images(project_name, compose_name, compose_content, env_content)
+        if not service.get('build') and service.get('pull_policy') not in ('build', 'never')
+    }
+
+class ImageReferenceIndex:
+    """镜像与项目、容器之间的引用索引
+
+    记录 COMPOSE_ROOT 下每个项目 compose 文件引用的镜像（替换 .env 变量后），
+    以及每个镜像 ID 对应的容器。项目引用随项目索引的 generation 增量更新，
+    只重新解析内容发生变化的项目；容器列表按 container_ttl 秒缓存。
+    查询只访问内存中的映射，不会重新扫描。
+    """
+
+    def __init__(self, container_ttl=15):
+        self._lock = threading.RLock()
+        self._container_ttl = container_ttl
+        self._project_source = None
+        self._generation = None
+        # 项目名 -> (compose 内容, .env 内容, compose 名称, 镜像引用集合)
+        self._projects = {}
+        # 规范化引用 -> 项目集合
+        self._references = {}
+        # 镜像 ID -> [{'name', 'project'}]
+        self._containers = {}
+        self._containers_loaded = 0
+
+    def set_project_source(self, source):
+        """设置项目来源 source() -> (generation, 项目列表)，项目列表为项目索引中的条目"""
+        self._project_source = source
+
+    def refresh(self):
+        """增量刷新项目引用，容器列表过期时重新获取"""
+        if self._project_source:
+            try:
+                generation, projects = self._project_source()
+                self.update_projects(projects, generation)
+            except Exception as e:
+                logger.error(f"Error refreshing project image references: {e}")
+        if time.time() - self._containers_loaded > self._container_ttl:
+            self.refresh_containers()
+
+    def update_projects(self, projects, generation=None):
+        """根据项目索引条目更新引用，generation 未变化时直接返回"""
+        with self._lock:
+            if generation is not None and generation == self._generation:
+                return
+            updated = {}
+            for project in projects:
+                name = project['name']
+                key = (project.get('compose_content'), project.get('env_content'), project.get('compose_name'))
+                cached = self._projects.get(name)
+                if cached and cached[:3] == key:
+                    updated[name] = cached
+                else:
+                    updated[name] = key + (project_image_refs(name, key[2], key[0], key[1]),)
+            self._projects = updated
+            references = {}
+            for name, cached in updated.items():
+                for ref in cached[3]:
+                    references.setdefault(normalize_image_ref(ref), set()).add(name)
+            self._references = references
+            self._generation = generation
+
+    def refresh_containers(self):
+        """重新获取所有容器使用的镜像 ID"""
+        try:
+            containers = shared_client.get().api.containers(all=True)
+        except Exception as e:
+            logger.error(f"Error listing containers for image references: {e}")
+            containers = None
+        with self._lock:
+            self._containers_loaded = time.time()
+            if containers is None:
+                return
+            by_image = {}
+            for container in containers:
+                names = container.get('Names') or []
+                by_image.setdefault(container.get('ImageID'), []).append({
+                    'name': names[0].lstrip('/') if names else container['Id'][:12],
+                    'project': (container.get('Labels') or {}).get(COMPOSE_PROJECT_LABEL)
+                })
+            self._containers = by_image
+
+    def project_refs(self):
+        """返回 {项目: 镜像引用集合}"""
+        with self._lock:
+            return {name: set(cached[3]) for name, cached in self._projects.items()}
+
+    def projects_for_ref(self, ref):
+        """返回引用该镜像的项目"""
+        with self._lock:
+            return sorted(self._references.get(normalize_image_ref(ref), ()))
+
+    def lookup(self, image_id, tags=()):
+        """返回使用该镜像的项目（按标签匹配 compose 引用）和容器（按镜像 ID 匹配）"""
+        with self._lock:
+            projects = set()
+            for tag in tags:
+                projects.update(self._references.get(normalize_image_ref(tag), ()))
+            return {
+                'projects': sorted(projects),
+                'containers': list(self._containers.get(image_id, []))
+            }
+
+    def snapshot(self):
+        """返回完整的引用表"""
+        with self._lock:
+            return {
+                'projects': {name: sorted(cached[3]) for name, cached in sorted(self._projects.items())},
+                'references': {ref: sorted(projects) for ref, projects in sorted(self._references.items())},
+                'containers': {image_id: list(containers) for image_id, containers in self._containers.items()}
+            }
+
+# 全局镜像引用索引，项目来源由 compose_manager 设置
+image_reference_index = ImageReferenceIndex()
@@ -106,7 +106,8 @@ LANG = {
             'tags': 'Tags',
             'size': 'Size',
             'created': 'Created',
-            'status': 'Status'
+            'status': 'Status',
+            'used_by': 'Used By'
         },
         'status': {
             'in_use': 'In Use',
@@ -158,6 +159,9 @@ LANG = {
         'project': {
             'containers': 'Containers',
             'created': 'Created',
+            'usage': 'Resource usage',
+            'memory': 'Memory',
+            'block_io': 'Disk I/O',
             'status': {
                 'running': 'Running',
                 'stopped': 'Stopped',
@@ -206,7 +210,10 @@ LANG = {
             'placeholder': '/mnt/nas/docker',
             'browse': 'Browse',
             'select_title': 'Select Directory',
-            'select': 'Select This Directory'
+            'select': 'Select This Directory',
+            'filter': 'Filter by name prefix',
+            'load_more': 'Load more',
+            'count': '{total} directories'
         },
         'logs': {
             'title': 'Operation Logs',
@@ -218,13 +225,38 @@ LANG = {
             'project': 'Project',
             'status': 'Status',
             'message': 'Message',
+            'filter': {
+                'all': 'All',
+                'start': 'From',
+                'end': 'To',
+                'apply': 'Filter',
+                'reset': 'Reset'
+            },
+            'pagination': {
+                'prev': 'Previous',
+                'next': 'Next',
+                'summary': '{total} entries, page {page}/{pages}'
+            },
+            'empty': 'No matching entries',
+            'load_earlier': 'Load earlier lines',
+            'follow': 'Follow',
+            'search': {
+                'title': 'Log Search',
+                'placeholder': 'Search keywords',
+                'level': 'Level',
+                'file': 'File',
+                'button': 'Search',
+                'days': 'Last {days} days',
+                'summary': '{total} entries found in {duration}s'
+            },
             'status_types': {
                 'success': 'Success',
                 'error': 'Failed'
             },
             'error': {
                 'get_content': 'Failed to get log content',
-                'get_content_error': 'Error getting log content'
+                'get_content_error': 'Error getting log content',
+                'search_error': 'Error searching logs'
             }
         }
     },
@@ -107,7 +107,8 @@ LANG = {
             'tags': '标签',
             'size': '大小',
             'created': '创建时间',
-            'status': '状态'
+            'status': '状态',
+            'used_by': '使用者'
         },
         'status': {
             'in_use': '使用中',
@@ -159,6 +160,9 @@ LANG = {
         'project': {
             'containers': '容器数量',
             'created': '创建时间',
+            'usage': '资源使用',
+            'memory': '内存',
+            'block_io': '磁盘读写',
             'status': {
                 'running': '运行中',
                 'stopped': '已停止',
@@ -207,7 +211,10 @@ LANG = {
             'placeholder': '/mnt/nas/docker',
             'browse': '浏览',
             'select_title': '选择目录',
-            'select': '选择此目录'
+            'select': '选择此目录',
+            'filter': '按名称前缀筛选',
+            'load_more': '加载更多',
+            'count': '共 {total} 个目录'
         },
         'logs': {
             'title': '操作日志',
@@ -219,13 +226,38 @@ LANG = {
             'project': '项目',
             'status': '状态',
             'message': '消息',
+            'filter': {
+                'all': '全部',
+                'start': '开始时间',
+                'end': '结束时间',
+                'apply': '筛选',
+                'reset': '重置'
+            },
+            'pagination': {
+                'prev': '上一页',
+                'next': '下一页',
+                'summary': '共 {total} 条，第 {page}/{pages} 页'
+            },
+            'empty': '没有符合条件的记录',
+            'load_earlier': '加载更早的内容',
+            'follow': '实时跟踪',
+            'search': {
+                'title': '日志搜索',
+                'placeholder': '搜索关键字',
+                'level': '级别',
+                'file': '文件',
+                'button': '搜索',
+                'days': '最近 {days} 天',
+                'summary': '找到 {total} 条记录，耗时 {duration} 秒'
+            },
             'status_types': {
                 'success': '成功',
                 'error': '失败'
             },
             'error': {
                 'get_content': '获取日志内容失败',
-                'get_content_error': '获取日志内容出错'
+                'get_content_error': '获取日志内容出错',
+                'search_error': '搜索日志出错'
             }
         }
     },
@@ -0,0 +1,83 @@
+import os
+
+# 从文件末尾向前查找换行符时每次读取的块大小
+TAIL_BLOCK_SIZE = 64 * 1024
+
+def read_range(path, offset=0, length=None):
+    """读取 [offset, offset + length) 范围的字节，返回 (内容, 起始偏移, 结束偏移, 文件大小)
+
+    offset 为负数时表示距文件末尾的字节数
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset < 0:
+            offset = max(0, size + offset)
+        offset = min(offset, size)
+        if length is None or offset + length > size:
+            length = size - offset
+        f.seek(offset)
+        data = f.read(length)
+    return data.decode('utf-8', errors='replace'), offset, offset + len(data), size
+
+def tail_lines(path, lines, before=None):
+    """从文件末尾（或 before 偏移处）向前读取最后 lines 行
+
+    只读取包含这些行的块，返回 (内容, 起始偏移, 结束偏移, 文件大小)，
+    起始偏移总在行首，可作为 before 继续向前翻页
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if before is None else max(0, min(before, size))
+        position = end
+        chunks = []
+        newlines = 0
+        # 末尾的换行符属于最后一行，不计入行数
+        skip_last = True
+        while position > 0 and newlines <= lines:
+            block = min(TAIL_BLOCK_SIZE, position)
+            position -= block
+            f.seek(position)
+            chunk = f.read(block)
+            if skip_last and chunk.endswith(b'\n'):
+                newlines -= 1
+            skip_last = False
+            newlines += chunk.count(b'\n')
+            chunks.append(chunk)
+
+    data = b''.join(reversed(chunks))
+    start = position
+    # 去掉超出所需行数的部分，使内容从行首开始
+    excess = newlines - lines
+    if excess >= 0:
+        cut = -1
+        for _ in range(excess + 1):
+            cut = data.index(b'\n', cut + 1)
+        data = data[cut + 1:]
+        start = end - len(data)
+    return data.decode('utf-8', errors='replace'), start, end, size
+
+def read_new_lines(path, offset, max_bytes=None):
+    """读取 offset 之后新追加的完整行，返回 (行列表, 新偏移)
+
+    末尾不完整的行留到下次读取；文件被截断或替换为更小的文件时从头开始。
+    每次最多读取 max_bytes 字节，其余内容由调用方下次读取；
+    单行超过 max_bytes 时按 max_bytes 切分返回，避免一直停在该行
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < offset:
+            offset = 0
+        if size == offset:
+            return [], offset
+        length = size - offset
+        if max_bytes is not None:
+            length = min(length, max_bytes)
+        f.seek(offset)
+        data = f.read(length)
+    complete = data.rfind(b'\n') + 1
+    if not complete:
+        if max_bytes is None or len(data) < max_bytes:
+            return [], offset
+        complete = len(data)
+    lines = data[:complete].decode('utf-8', errors='replace').splitlines()
+    return lines, offset + complete
@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import logging
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.search')
+
+# 参与索引的日志文件
+LOG_FILE_PATTERN = re.compile(r'^(compose_\d{8}|docker-manager-\d{4}-\d{2}-\d{2})\.log$')
+
+# compose_manager: "2024-01-01 12:00:00,123 - INFO - message"
+COMPOSE_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ - ([A-Z]+) - (.*)$')
+# docker_manager.go: "INFO: 2024/01/01 12:00:00 docker_manager.go:123: message"
+GO_LINE = re.compile(r'^([A-Z]+): (\d{4})/(\d{2})/(\d{2}) (\d{2}:\d{2}:\d{2}) (.*)$')
+# log_operation 写入的消息: "operation - project - message"
+OPERATION_MESSAGE = re.compile(r'^([a-z_]+) - (.+?) - ')
+# 部署等命令的输出: "project - line"，stderr 为 ERROR 级别
+PROJECT_SEPARATOR = ' - '
+
+# 解析规则变化时递增，旧版本建立的索引会被清空重建
+INDEX_VERSION = 2
+
+# 单次索引读取的最大字节数，超出部分留到下次更新
+MAX_INDEX_BYTES = 16 * 1024 * 1024
+
+def _known_prefix(message, projects):
+    """返回 message 开头 "project - " 中的已知项目名（项目名本身可能包含 " - "）"""
+    position = message.find(PROJECT_SEPARATOR)
+    while position > 0:
+        if message[:position] in projects:
+            return message[:position]
+        position = message.find(PROJECT_SEPARATOR, position + 1)
+    return None
+
+def message_project(message, projects=()):
+    """从消息中取出项目名
+
+    有已知项目名时优先按项目名匹配：先看 log_operation 格式中操作名之后的部分，
+    再看部署等命令输出的 "project - " 前缀；都不匹配时按 log_operation 的格式猜测
+    """
+    operation = OPERATION_MESSAGE.match(message)
+    if projects:
+        if operation:
+            project = _known_prefix(message[operation.end(1) + len(PROJECT_SEPARATOR):], projects)
+            if project:
+                return project
+        project = _known_prefix(message, projects)
+        if project:
+            return project
+    return operation.group(2) if operation else None
+
+def parse_line(line, projects=()):
+    """解析一行日志，返回 (时间, 级别, 项目, 消息)，无法识别的行（如多行输出的后续行）返回 None
+
+    projects 为已知的项目名集合，用于识别部署输出等以 "project - " 开头的消息
+    """
+    match = COMPOSE_LINE.match(line)
+    if match:
+        timestamp, level, message = match.groups()
+    else:
+        match = GO_LINE.match(line)
+        if not match:
+            return None
+        level, year, month, day, clock, message = match.groups()
+        timestamp = f'{year}-{month}-{day} {clock}'
+    return timestamp, level, message_project(message, projects), message
+
+class LogSearchIndex:
+    """compose_*.log 和 docker-manager-*.log 的增量全文索引
+
+    每个文件记录已索引到的字节偏移，更新时只解析新追加的完整行；
+    文件被截断或替换时重新索引，文件删除后移除对应记录。
+    可用时使用 FTS5 trigram 索引做子串匹配，否则退化为 LIKE 查询。
+    """
+
+    def __init__(self, db_path, log_dir, min_update_interval=2, project_source=None):
+        self._db_path = db_path
+        self._log_dir = log_dir
+        # 返回已知项目名集合的函数
+        self._project_source = project_source
+        self._min_update_interval = min_update_interval
+        self._last_update = 0
+        self._update_lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    name TEXT PRIMARY KEY,
+                    inode INTEGER,
+                    offset INTEGER NOT NULL,
+                    last_timestamp TEXT,
+                    last_level TEXT,
+                    last_project TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    timestamp TEXT,
+                    level TEXT,
+                    project TEXT,
+                    message TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_level ON entries (level, timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_project ON entries (project, timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_file ON entries (file)')
+            self._fts = self._create_fts(conn)
+            if conn.execute('PRAGMA user_version').fetchone()[0] < INDEX_VERSION:
+                # 旧版本没有识别部署输出的项目，清空后由下次更新重新索引
+                for row in conn.execute('SELECT name FROM files').fetchall():
+                    self._delete_file_entries(conn, row['name'])
+                conn.execute('DELETE FROM files')
+                conn.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA busy_timeout=30000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_fts(conn):
+        """创建 FTS5 外部内容表，SQLite 不支持时返回 False
+
+        不使用逐行触发器同步，而是每批插入后整批写入全文索引，索引速度快数倍
+        """
+        try:
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+                USING fts5(message, content='entries', content_rowid='id', tokenize='trigram')
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.info(f"FTS5 trigram unavailable, log search falls back to LIKE: {e}")
+            return False
+        return True
+
+    def start(self, interval=5):
+        """启动后台线程定期索引新内容（重复调用无副作用）"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.update(force=True)
+                except Exception as e:
+                    logger.error(f"Error updating log index: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name='log-index', daemon=True)
+        self._thread.start()
+
+    def update(self, force=False):
+        """索引新追加的日志内容
+
+        非强制更新时，两次更新间隔不足 min_update_interval 秒或其他线程正在索引则直接返回
+        """
+        if not self._update_lock.acquire(blocking=force):
+            return
+        try:
+            if not force and time.time() - self._last_update < self._min_update_interval:
+                return
+            started = time.monotonic()
+            conn = self._connect()
+            indexed = {row['name']: row for row in conn.execute('SELECT * FROM files')}
+            present = set()
+            added = 0
+            for filename in os.listdir(self._log_dir):
+                if not LOG_FILE_PATTERN.match(filename):
+                    continue
+                present.add(filename)
+                try:
+                    added += self._index_file(conn, filename, indexed.get(filename))
+                except OSError as e:
+                    logger.error(f"Error indexing log file {filename}: {e}")
+
+            for filename in set(indexed) - present:
+                with conn:
+                    self._delete_file_entries(conn, filename)
+                    conn.execute('DELETE FROM files WHERE name = ?', (filename,))
+            self._last_update = time.time()
+            if added:
+                logger.debug(f"Indexed {added} log lines in {time.monotonic() - started:.3f}s")
+        finally:
+            self._update_lock.release()
+
+    def _index_file(self, conn, filename, state):
+        path = os.path.join(self._log_dir, filename)
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            offset = state['offset'] if state else 0
+            last = (state['last_timestamp'], state['last_level'], state['last_project']) if state else (None, None, None)
+            if state and (state['inode'] != st.st_ino or st.st_size < offset):
+                # 文件被截断或替换，重新索引
+                with conn:
+                    self._delete_file_entries(conn, filename)
+                offset = 0
+                last = (None, None, None)
+            if st.st_size == offset and state:
+                return 0
+            f.seek(offset)
+            data = f.read(min(st.st_size - offset, MAX_INDEX_BYTES))
+
+        complete = data.rfind(b'\n') + 1
+        lines = data[:complete].split(b'\n')[:-1]
+        if not complete and len(data) >= MAX_INDEX_BYTES:
+            # 单行超过 MAX_INDEX_BYTES 时把已读到的部分作为一行索引并前进，
+            # 否则偏移永远停在这里；该行的剩余部分下次作为后续行索引
+            lines = [data]
+            complete = len(data)
+        projects = self._known_projects()
+        rows = []
+        position = offset
+        for raw in lines:
+            line = raw.decode('utf-8', errors='replace').rstrip('\r')
+            parsed = parse_line(line, projects)
+            if parsed:
+                last = parsed[:3]
+                rows.append((filename, position) + parsed)
+            elif line.strip():
+                # 多行日志的后续行沿用上一条日志的时间、级别和项目
+                rows.append((filename, position) + last + (line,))
+            position += len(raw) + 1
+
+        with conn:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM entries').fetchone()[0]
+            conn.executemany(
+                'INSERT INTO entries (file, offset, timestamp, level, project, message) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            if self._fts and rows:
+                conn.execute(
+                    'INSERT INTO entries_fts (rowid, message) SELECT id, message FROM entries WHERE id > ?',
+                    (last_id,)
+                )
+            conn.execute(
+                'INSERT OR REPLACE INTO files (name, inode, offset, last_timestamp, last_level, last_project) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (filename, st.st_ino, offset + complete) + last
+            )
+        return len(rows)
+
+    def _known_projects(self):
+        if not self._project_source:
+            return set()
+        try:
+            return set(self._project_source())
+        except Exception as e:
+            logger.error(f"Error getting project names for log index: {e}")
+            return set()
+
+    def _delete_file_entries(self, conn, filename):
+        if self._fts:
+            conn.execute(
+                "INSERT INTO entries_fts (entries_fts, rowid, message) "
+                "SELECT 'delete', id, message FROM entries WHERE file = ?",
+                (filename,)
+            )
+        conn.execute('DELETE FROM entries WHERE file = ?', (filename,))
+
+    def search(self, query=None, level=None, project=None, start=None, end=None, limit=100, offset=0):
+        """按关键字、级别、项目和时间范围查询（时间倒序），返回 (记录列表, 总数)"""
+        self.update()
+        conditions = []
+        params = []
+        terms = (query or '').split()
+        if terms and self._fts and all(len(term) >= 3 for term in terms):
+            # 每个词作为短语匹配，避免用户输入被解释为 FTS 语法
+            conditions.append('id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)')
+            params.append(' '.join('"{}"'.format(term.replace('"', '""')) for term in terms))
+        else:
+            for term in terms:
+                conditions.append("message LIKE ? ESCAPE '\\'")
+                params.append('%' + re.sub(r'([%_\\])', r'\\\1', term) + '%')
+        if level:
+            conditions.append('level = ?')
+            params.append(level.upper())
+        if project:
+            conditions.append('project = ?')
+            params.append(project)
+        if start:
+            conditions.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            conditions.append('timestamp <= ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM entries {where}', params).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT file, offset, timestamp, level, project, message FROM entries {where} '
+            f'ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows], total
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+
+# 作为 compose_manager 的子记录器，日志写入 compose 日志文件
+logger = logging.getLogger('compose_manager.history')
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class OperationHistory:
+    """基于 SQLite 的只追加操作历史
+
+    每条记录一次 INSERT，多个线程/进程可同时写入（WAL 模式），
+    按时间保留记录，查询按项目、操作、状态和时间范围在数据库中过滤并分页。
+    """
+
+    def __init__(self, db_path, retention_days=90, legacy_json=None):
+        self._db_path = db_path
+        self._retention_days = retention_days
+        self._local = threading.local()
+        self._last_prune = 0
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS operations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    project TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    message TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_timestamp ON operations (timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_operations_project ON operations (project, timestamp)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        if legacy_json:
+            self._import_legacy(legacy_json)
+        self.prune()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def append(self, entry):
+        """追加一条记录"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO operations (timestamp, operation, project, status, message) VALUES (?, ?, ?, ?, ?)',
+                (entry['timestamp'], entry['operation'], entry['project'], entry['status'], entry.get('message', ''))
+            )
+        # 每小时最多清理一次过期记录
+        if time.time() - self._last_prune > 3600:
+            self.prune()
+
+    def prune(self):
+        """删除超过保留期限的记录"""
+        self._last_prune = time.time()
+        if not self._retention_days:
+            return
+        cutoff = (datetime.now() - timedelta(days=self._retention_days)).strftime(TIMESTAMP_FORMAT)
+        with self._connect() as conn:
+            deleted = conn.execute('DELETE FROM operations WHERE timestamp < ?', (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} operation history entries older than {cutoff}")
+
+    def query(self, project=None, operation=None, status=None, start=None, end=None, limit=50, offset=0):
+        """按条件查询记录（时间倒序），返回 (记录列表, 总数)"""
+        conditions = []
+        params = []
+        for column, value in (('project', project), ('operation', operation), ('status', status)):
+            if value:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if start:
+            conditions.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            conditions.append('timestamp <= ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM operations {where}', params).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT timestamp, operation, project, status, message FROM operations {where} '
+            f'ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def distinct(self, column):
+        """返回某一列的所有取值，用于筛选下拉框"""
+        if column not in ('project', 'operation', 'status'):
+            raise ValueError(f'不支持的列: {column}')
+        rows = self._connect().execute(f'SELECT DISTINCT {column} FROM operations ORDER BY {column}').fetchall()
+        return [row[0] for row in rows]
+
+    def _import_legacy(self, json_path):
+        """一次性导入旧的 operation_history.json"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        entries = []
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except Exception as e:
+                logger.error(f"Error importing legacy operation history {json_path}: {e}")
+                return
+        with conn:
+            conn.executemany(
+                'INSERT INTO operations (timestamp, operation, project, status, message) VALUES (?, ?, ?, ?, ?)',
+                [(e.get('timestamp', ''), e.get('operation', ''), e.get('project', ''),
+                  e.get('status', ''), e.get('message', '')) for e in entries]
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', ?)",
+                         (datetime.now().strftime(TIMESTAMP_FORMAT),))
+        if entries:
+            logger.info(f"Imported {len(entries)} entries from {json_path}")